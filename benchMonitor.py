@@ -0,0 +1,436 @@
+import argparse
+import gzip
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import psutil
+
+import monitor
+
+# Misst den Eigenverbrauch von monitor.py und prüft das Verhalten bei wachsender Historie.
+#
+#   bench: startet monitor.py --headless in einem temporären Verzeichnis. nvidia-smi ist dabei durch
+#          fakeNvidiaSmi.py ersetzt, Telegram und Notion durch einen lokalen Stub-Server. Gemessen werden
+#          CPU-Zeit pro Durchlauf, Abweichung der Durchläufe vom Takt, RSS-Zuwachs und geschriebene Bytes pro Stunde.
+#   soak:  erzeugt die Log-Dateien eines ganzen Jahres und misst Neuaufbau und Fortschreibung der Gesamtzeit
+#          sowie die Abfragen, mit denen das Dashboard lädt. Die berechnete Gesamtzeit wird mit der erwarteten verglichen.
+#   fleet: startet einen Collector und mehrere Agenten auf localhost, jeden in einem eigenen temporären Verzeichnis, und
+#          vergleicht danach Sitzungen und Gesamtzeit jedes Agenten mit dem Stand des Collectors. Optional schicken
+#          zusätzlich simulierte Rechner Pakete direkt an den Collector, um den Durchsatz zu messen.
+#
+# Der Ersatz für nvidia-smi wird als Shell-Skript in den PATH gelegt und funktioniert daher nur unter Linux und macOS.
+
+SCRIPT_DIR = Path(__file__).parent
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Antwortet wie die Telegram- und Notion-API, zählt aber nur die Anfragen
+    counts = {}
+    counts_lock = threading.Lock()
+
+    def handle_request(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        kind = self.path.rstrip('/').rsplit('/', 1)[-1].split('?')[0]
+        with self.counts_lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+        if kind == 'getUpdates':
+            # Long Polling nachbilden, sonst fragt der Bot ohne Pause neu an
+            time.sleep(1)
+            body = {"ok": True, "result": []}
+        elif kind == 'sendMessage':
+            body = {"ok": True, "result": {"message_id": 1, "date": int(time.time()), "chat": {"id": 1, "type": "private"}}}
+        elif kind == 'query':
+            body = {"results": []}
+        elif '/databases/' in self.path and self.command == 'GET':
+            body = {"properties": {"Session ID": {"type": "rich_text", "rich_text": {}}}}
+        else:
+            body = {"ok": True, "result": {}}
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = handle_request
+    do_POST = handle_request
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def install_fake_nvidia_smi(bin_dir):
+    wrapper = bin_dir / 'nvidia-smi'
+    wrapper.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{SCRIPT_DIR / "fakeNvidiaSmi.py"}" "$@"\n')
+    wrapper.chmod(0o755)
+
+def prepare_instance(work_dir, config):
+    # Eigenes Verzeichnis pro Instanz: eigene config.json, eigene Sperrdatei, eigenes LOG_DIR
+    work_dir.mkdir(exist_ok=True)
+    for name in ('monitor.py', 'dashboard.html'):
+        shutil.copy(SCRIPT_DIR / name, work_dir / name)
+    (work_dir / 'config.json').write_text(json.dumps(config, indent=4))
+
+def get_dir_size(path):
+    return sum(file.stat().st_size for file in path.rglob('*') if file.is_file())
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+def run_bench(args):
+    if sys.platform == 'win32':
+        print("Der Benchmark benötigt ein POSIX-System (nvidia-smi wird durch ein Shell-Skript ersetzt).")
+        return 1
+    stub_server = start_stub_server()
+    stub_url = f"http://127.0.0.1:{stub_server.server_address[1]}"
+    with tempfile.TemporaryDirectory() as work_dir:
+        work_dir = Path(work_dir)
+        bin_dir = work_dir / 'bin'
+        bin_dir.mkdir()
+        install_fake_nvidia_smi(bin_dir)
+        config = {
+            "GPU_USAGE_THRESHOLD": 30,
+            "CHECK_INTERVAL": args.interval,
+            "LOG_INTERVAL": args.log_interval,
+            "COOL_DOWN_PERIOD": args.cool_down,
+            "LOG_DIR": "./logs",
+            "ENABLE_TELEGRAM": not args.no_stubs,
+            "TELEGRAM_BOT_TOKEN": "123:bench",
+            "TELEGRAM_CHAT_ID": "1",
+            "TELEGRAM_API_URL": stub_url + "/bot{0}/{1}",
+            "ENABLE_NOTION": not args.no_stubs,
+            "NOTION_TOKEN": "bench",
+            "NOTION_DATABASE_ID": "bench",
+            "NOTION_API_URL": stub_url + "/v1",
+            "ENABLE_ATTRIBUTION": args.attribution,
+            "ADAPTIVE_SAMPLING": args.adaptive
+        }
+        prepare_instance(work_dir, config)
+        env = dict(os.environ)
+        env['PATH'] = f"{bin_dir}{os.pathsep}{env.get('PATH', '')}"
+        env['FAKE_NVIDIA_SMI_GPUS'] = str(args.gpus)
+        if args.trace:
+            env['FAKE_NVIDIA_SMI_TRACE'] = str(Path(args.trace).resolve())
+
+        with open(work_dir / 'monitor.out', 'w') as output:
+            process = subprocess.Popen([sys.executable, 'monitor.py', '--headless'], cwd=work_dir, env=env,
+                                       stdout=output, stderr=subprocess.STDOUT)
+        monitored = psutil.Process(process.pid)
+        log_dir = work_dir / 'logs'
+        try:
+            # Warten, bis die ersten Messungen geschrieben sind
+            deadline = time.monotonic() + 30
+            while not list(log_dir.glob('samples_*.bin')):
+                if process.poll() is not None or time.monotonic() > deadline:
+                    print("monitor.py ist nicht angelaufen:")
+                    print((work_dir / 'monitor.out').read_text())
+                    return 1
+                time.sleep(0.2)
+            time.sleep(args.warmup)
+
+            start_time = datetime.now()
+            start_cpu = sum(monitored.cpu_times()[:2])
+            start_rss = monitored.memory_info().rss
+            start_size = get_dir_size(log_dir)
+            time.sleep(args.duration)
+            end_time = datetime.now()
+            end_cpu = sum(monitored.cpu_times()[:2])
+            end_rss = monitored.memory_info().rss
+            end_size = get_dir_size(log_dir)
+        finally:
+            (work_dir / 'stop_monitor.txt').touch()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            stub_server.shutdown()
+
+        monitor.CONFIG = {'LOG_DIR': log_dir}
+        timestamps = [sample[0] for sample in monitor.read_samples(start_time, end_time, log_dir)]
+        ticks = len(timestamps)
+        intervals = [b - a for a, b in zip(timestamps, timestamps[1:])]
+        hours = (end_time - start_time).total_seconds() / 3600
+
+        print(f"{args.gpus} GPU(s), CHECK_INTERVAL {args.interval}s, {args.duration}s gemessen, {ticks} Durchläufe")
+        if ticks:
+            print(f"{'CPU-Zeit pro Durchlauf':<32}{(end_cpu - start_cpu) / ticks * 1000:>10.2f} ms")
+        if intervals:
+            deviations = [abs(interval - args.interval) for interval in intervals]
+            print(f"{'Mittleres Intervall':<32}{statistics.mean(intervals) * 1000:>10.1f} ms")
+            print(f"{'Abweichung p50 / p99 / max':<32}{percentile(deviations, 0.5) * 1000:>10.2f} / "
+                  f"{percentile(deviations, 0.99) * 1000:.2f} / {max(deviations) * 1000:.2f} ms")
+        print(f"{'RSS Beginn / Ende':<32}{start_rss / 1024 / 1024:>10.1f} / {end_rss / 1024 / 1024:.1f} MB")
+        print(f"{'RSS-Zuwachs pro Stunde':<32}{(end_rss - start_rss) / 1024 / 1024 / hours:>10.2f} MB")
+        print(f"{'Geschrieben pro Stunde':<32}{(end_size - start_size) / 1024 / hours:>10.1f} KB")
+        if StubHandler.counts:
+            print("Anfragen an den Stub-Server: " + ", ".join(f"{kind} {count}" for kind, count in sorted(StubHandler.counts.items())))
+    return 0
+
+def generate_history(log_dir, days, sessions_per_day, gpus, seed):
+    # Ein Jahr Logs wie von monitor.py geschrieben: Sitzungen und reguläres Log pro Tag. Liefert die Summe aller Sitzungen.
+    rng = random.Random(seed)
+    first_day = datetime.combine(datetime.now().date(), datetime.min.time()) - timedelta(days=days)
+    device_totals = {device: 0.0 for device in range(gpus)}
+    for day_index in range(days):
+        day = first_day + timedelta(days=day_index)
+        date_str = day.strftime('%Y-%m-%d')
+        sessions = []
+        for device in range(gpus):
+            starts = sorted(rng.uniform(0, 86000) for _ in range(sessions_per_day))
+            for start in starts:
+                duration = round(rng.uniform(30, 3600), 3)
+                sessions.append((day + timedelta(seconds=start), device, duration))
+        rows = []
+        for start_time, device, duration in sorted(sessions):
+            device_totals[device] += duration
+            rows.append([start_time, start_time + timedelta(seconds=duration), duration, device, device_totals[device]])
+        monitor.log_rows_to_csv(log_dir / f"gpu_usage_log_{date_str}.csv", rows,
+                                ["Start Time", "End Time", "Duration (seconds)", "GPU", "GPU Total (seconds)"])
+        regular_rows = []
+        for minute in range(0, 24 * 60, 10):
+            timestamp = day + timedelta(minutes=minute)
+            utilization = [rng.randint(0, 100) for _ in range(gpus)]
+            regular_rows.append([timestamp, sum(utilization) / gpus, rng.uniform(0, 100), rng.uniform(20, 80),
+                                 json.dumps({"/": 50.0}), json.dumps([]), json.dumps([{"index": device, "utilization": value}
+                                 for device, value in enumerate(utilization)]), json.dumps([])])
+        monitor.log_rows_to_csv(log_dir / f"regular_log_{date_str}.csv", regular_rows,
+                                ["Timestamp", "GPU Usage", "CPU Usage", "RAM Usage", "Disk Usage", "Top Processes", "GPU Devices", "GPU Processes"])
+    return first_day, sum(device_totals.values())
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - started, result
+
+def run_soak(args):
+    failed = False
+    with tempfile.TemporaryDirectory() as log_dir:
+        log_dir = Path(log_dir)
+        monitor.CONFIG = {'LOG_DIR': log_dir, 'GPU_USAGE_THRESHOLD': 30, 'COOL_DOWN_PERIOD': 10, 'CHECK_INTERVAL': 5}
+        generate_seconds, (first_day, expected_total) = timed(generate_history, log_dir, args.days, args.sessions, args.gpus, args.seed)
+        monitor.last_reset_date = first_day
+        print(f"{args.days} Tage, {args.gpus} GPU(s), {args.sessions} Sitzungen pro GPU und Tag, "
+              f"{get_dir_size(log_dir) / 1024 / 1024:.1f} MB Logs (erzeugt in {generate_seconds:.1f}s)")
+
+        results = []
+        seconds, total = timed(monitor.rebuild_ledger)
+        results.append(("Gesamtzeit neu berechnen", seconds))
+        if abs(total - expected_total) > 1e-3 * args.days:
+            print(f"FEHLER: Gesamtzeit {total:.3f}s, erwartet {expected_total:.3f}s")
+            failed = True
+        results.append(("Ledger laden", timed(monitor.load_ledger)[0]))
+
+        # Eine weitere Sitzung fortschreiben, wie am Ende einer Nutzungssitzung
+        session_start = datetime.now() - timedelta(minutes=5)
+        seconds, total = timed(monitor.log_gpu_usage, 0, session_start, session_start + timedelta(seconds=120), 120)
+        results.append(("Sitzung eintragen", seconds))
+        if abs(total - expected_total - 120) > 1e-3 * args.days:
+            print(f"FEHLER: Gesamtzeit nach neuer Sitzung {total:.3f}s, erwartet {expected_total + 120:.3f}s")
+            failed = True
+
+        results.append(("Rollups neu aufbauen", timed(monitor.rebuild_rollups)[0]))
+        end_time = datetime.now() + timedelta(days=1)
+        seconds, rows = timed(monitor.query_rollups, 'day', first_day, end_time)
+        results.append((f"Dashboard: alle Tage ({len(rows)} Zeilen)", seconds))
+        last_day = first_day + timedelta(days=args.days - 1)
+        seconds, rows = timed(monitor.query_rollups, 'minute', last_day, last_day + timedelta(days=1))
+        results.append((f"Dashboard: ein Tag ({len(rows)} Zeilen)", seconds))
+        seconds, rows = timed(monitor.query_sessions, first_day, end_time)
+        results.append((f"Dashboard: Sitzungen ({len(rows)})", seconds))
+        results.append(("Dashboard: Sitzungen (Cache)", timed(monitor.query_sessions, first_day, end_time)[0]))
+
+        # Dasselbe nach dem Verdichten: komprimierte Monatsarchive mit Index
+        session_count = len(rows)
+        size_before = get_dir_size(log_dir)
+        seconds, (compressed, archived, _) = timed(monitor.compact_logs)
+        results.append((f"Logs verdichten ({compressed} + {archived} Dateien)", seconds))
+        seconds, total = timed(monitor.rebuild_ledger)
+        results.append(("Gesamtzeit neu berechnen (verdichtet)", seconds))
+        if abs(total - expected_total - 120) > 1e-3 * args.days:
+            print(f"FEHLER: Gesamtzeit nach dem Verdichten {total:.3f}s, erwartet {expected_total + 120:.3f}s")
+            failed = True
+        seconds, rows = timed(monitor.query_sessions, first_day, end_time)
+        results.append((f"Dashboard: Sitzungen verdichtet ({len(rows)})", seconds))
+        if len(rows) != session_count:
+            print(f"FEHLER: {len(rows)} Sitzungen nach dem Verdichten, erwartet {session_count}")
+            failed = True
+        print(f"Log-Verzeichnis vor/nach dem Verdichten: {size_before / 1024 / 1024:.1f} / {get_dir_size(log_dir) / 1024 / 1024:.1f} MB")
+
+        for label, seconds in results:
+            print(f"{label:<40}{seconds * 1000:>12.1f} ms")
+    print("Gesamtzeit: FEHLER" if failed else "Gesamtzeit: OK")
+    return 1 if failed else 0
+
+def fetch_json(url):
+    with urllib.request.urlopen(url, timeout=30) as response:
+        return json.loads(response.read())
+
+def post_synthetic_batch(url, host, batch, gpus, samples_per_batch):
+    # Ein Paket wie von einem Agenten: Messungen im Sekundentakt und eine abgeschlossene Sitzung
+    start = datetime(2024, 1, 1) + timedelta(hours=batch)
+    samples = [[(start + timedelta(seconds=i)).timestamp(), 10.0, 50.0, [[device, (i + device * 7) % 101] for device in range(gpus)]]
+               for i in range(samples_per_batch)]
+    sessions = [{'id': f"{start.isoformat()}#GPU0", 'device': 0, 'start_time': start.isoformat(),
+                 'end_time': (start + timedelta(seconds=60)).isoformat(), 'duration': 60.0}]
+    body = gzip.compress(json.dumps({'host': host, 'samples': samples, 'sessions': sessions, 'status': None}).encode('utf-8'))
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+    with urllib.request.urlopen(request, timeout=60) as response:
+        response.read()
+    return len(body)
+
+def run_fleet(args):
+    if sys.platform == 'win32':
+        print("Der Benchmark benötigt ein POSIX-System (nvidia-smi wird durch ein Shell-Skript ersetzt).")
+        return 1
+    failed = False
+    with tempfile.TemporaryDirectory() as work_dir:
+        work_dir = Path(work_dir)
+        bin_dir = work_dir / 'bin'
+        bin_dir.mkdir()
+        install_fake_nvidia_smi(bin_dir)
+        collector_url = f"http://127.0.0.1:{args.port}"
+        prepare_instance(work_dir / 'collector', {"LOG_DIR": "./logs", "FLEET_PORT": args.port, "GPU_USAGE_THRESHOLD": 30,
+                                                  "CHECK_INTERVAL": 1, "LOG_INTERVAL": 600, "COOL_DOWN_PERIOD": args.cool_down})
+        processes = {}
+        with open(work_dir / 'collector.out', 'w') as output:
+            processes['collector'] = subprocess.Popen([sys.executable, 'monitor.py', '--collector'], cwd=work_dir / 'collector',
+                                                      stdout=output, stderr=subprocess.STDOUT)
+        try:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    fetch_json(collector_url + '/api/fleet')
+                    break
+                except OSError:
+                    if processes['collector'].poll() is not None or time.monotonic() > deadline:
+                        print("Collector ist nicht angelaufen:")
+                        print((work_dir / 'collector.out').read_text())
+                        return 1
+                    time.sleep(0.2)
+
+            for index in range(args.agents):
+                name = f"agent-{index + 1}"
+                agent_dir = work_dir / name
+                prepare_instance(agent_dir, {"LOG_DIR": "./logs", "GPU_USAGE_THRESHOLD": 30, "CHECK_INTERVAL": args.interval,
+                                             "LOG_INTERVAL": 600, "COOL_DOWN_PERIOD": args.cool_down, "FLEET_COLLECTOR_URL": collector_url,
+                                             "FLEET_HOST": name, "FLEET_PUSH_INTERVAL": args.push_interval})
+                env = dict(os.environ)
+                env['PATH'] = f"{bin_dir}{os.pathsep}{env.get('PATH', '')}"
+                env['FAKE_NVIDIA_SMI_GPUS'] = str(args.gpus)
+                env['FAKE_NVIDIA_SMI_SEED'] = str(index)
+                with open(work_dir / f"{name}.out", 'w') as output:
+                    processes[name] = subprocess.Popen([sys.executable, 'monitor.py', '--headless'], cwd=agent_dir, env=env,
+                                                       stdout=output, stderr=subprocess.STDOUT)
+
+            if args.load_hosts:
+                url = collector_url + '/api/fleet/ingest'
+                jobs = [(f"load-{host + 1}", batch) for batch in range(args.load_batches) for host in range(args.load_hosts)]
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=args.load_hosts) as executor:
+                    sizes = list(executor.map(lambda job: post_synthetic_batch(url, job[0], job[1], args.gpus, args.load_samples), jobs))
+                seconds = time.perf_counter() - started
+                print(f"{args.load_hosts} simulierte Rechner: {len(jobs)} Pakete mit je {args.load_samples} Messungen in {seconds:.2f}s "
+                      f"({len(jobs) / seconds:.0f} Pakete/s, {len(jobs) * args.load_samples / seconds:.0f} Messungen/s, "
+                      f"{statistics.mean(sizes) / 1024:.1f} KB pro Paket)")
+
+            time.sleep(args.duration)
+        finally:
+            # Agenten zuerst beenden, damit sie ihr letztes Paket noch schicken können
+            for name, process in processes.items():
+                if name != 'collector':
+                    (work_dir / name / 'stop_monitor.txt').touch()
+            for name, process in processes.items():
+                if name != 'collector':
+                    try:
+                        process.wait(timeout=30)
+                    except subprocess.TimeoutExpired:
+                        process.kill()
+            fleet = fetch_json(collector_url + '/api/fleet') if processes['collector'].poll() is None else None
+            processes['collector'].terminate()
+            try:
+                processes['collector'].wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                processes['collector'].kill()
+
+        if fleet is None:
+            print("Collector ist vorzeitig beendet worden:")
+            print((work_dir / 'collector.out').read_text())
+            return 1
+        print(f"{'Rechner':<12}{'Sitzungen':>20}{'Gesamtzeit (s)':>28}{'Messungen':>20}")
+        print(f"{'':<12}{'lokal / Collector':>20}{'lokal / Collector':>28}{'lokal / Collector':>20}")
+        for index in range(args.agents):
+            name = f"agent-{index + 1}"
+            log_dir = work_dir / name / 'logs'
+            fleet_dir = work_dir / 'collector' / 'logs' / 'fleet' / name
+            monitor.CONFIG = {'LOG_DIR': log_dir}
+            local_sessions = sum(1 for _ in monitor.iter_log_rows('gpu_usage_log', log_dir=log_dir))
+            remote_sessions = sum(1 for _ in monitor.iter_log_rows('gpu_usage_log', log_dir=fleet_dir))
+            local_total = json.loads((log_dir / 'usage_ledger.json').read_text())['total']
+            remote_total = fleet['hosts'].get(name, {}).get('total', 0)
+            period = (datetime(2000, 1, 1), datetime.now() + timedelta(days=1))
+            local_samples = len(monitor.read_samples(*period, log_dir))
+            remote_samples = len(monitor.read_samples(*period, fleet_dir)) if fleet_dir.exists() else 0
+            print(f"{name:<12}{f'{local_sessions} / {remote_sessions}':>20}{f'{local_total:.2f} / {remote_total:.2f}':>28}"
+                  f"{f'{local_samples} / {remote_samples}':>20}")
+            if local_sessions != remote_sessions or abs(local_total - remote_total) > 1e-6 or local_samples != remote_samples:
+                failed = True
+        print(f"Gesamtzeit der Flotte: {fleet['total']:.2f}s")
+    print("Flotte: FEHLER" if failed else "Flotte: OK")
+    return 1 if failed else 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark und Langzeittest für monitor.py")
+    subparsers = parser.add_subparsers(dest='mode', required=True)
+    bench = subparsers.add_parser('bench', help="Eigenverbrauch der Hauptschleife messen")
+    bench.add_argument("--duration", type=float, default=60, help="Messdauer in Sekunden")
+    bench.add_argument("--warmup", type=float, default=5, help="Wartezeit vor der Messung in Sekunden")
+    bench.add_argument("--interval", type=float, default=1, help="CHECK_INTERVAL in Sekunden")
+    bench.add_argument("--log-interval", type=float, default=60, help="LOG_INTERVAL in Sekunden")
+    bench.add_argument("--cool-down", type=float, default=5, help="COOL_DOWN_PERIOD in Sekunden")
+    bench.add_argument("--gpus", type=int, default=1, help="Anzahl simulierter GPUs")
+    bench.add_argument("--trace", help="CSV mit aufgezeichneter Auslastung (Spalten GPU 0, GPU 1, ...)")
+    bench.add_argument("--attribution", action='store_true', help="ENABLE_ATTRIBUTION einschalten")
+    bench.add_argument("--adaptive", action='store_true', help="ADAPTIVE_SAMPLING einschalten")
+    bench.add_argument("--no-stubs", action='store_true', help="Telegram und Notion ausschalten")
+    soak = subparsers.add_parser('soak', help="Ein Jahr Historie erzeugen und Gesamtzeit/Dashboard prüfen")
+    soak.add_argument("--days", type=int, default=365, help="Anzahl simulierter Tage")
+    soak.add_argument("--sessions", type=int, default=20, help="Sitzungen pro GPU und Tag")
+    soak.add_argument("--gpus", type=int, default=2, help="Anzahl simulierter GPUs")
+    soak.add_argument("--seed", type=int, default=0, help="Startwert für die Zufallsdaten")
+    fleet = subparsers.add_parser('fleet', help="Collector und mehrere Agenten auf localhost starten und abgleichen")
+    fleet.add_argument("--agents", type=int, default=3, help="Anzahl Agenten")
+    fleet.add_argument("--duration", type=float, default=60, help="Laufzeit der Agenten in Sekunden")
+    fleet.add_argument("--interval", type=float, default=1, help="CHECK_INTERVAL der Agenten in Sekunden")
+    fleet.add_argument("--push-interval", type=float, default=5, help="FLEET_PUSH_INTERVAL der Agenten in Sekunden")
+    fleet.add_argument("--cool-down", type=float, default=3, help="COOL_DOWN_PERIOD in Sekunden")
+    fleet.add_argument("--gpus", type=int, default=2, help="Anzahl simulierter GPUs pro Rechner")
+    fleet.add_argument("--port", type=int, default=8770, help="Port des Collectors")
+    fleet.add_argument("--load-hosts", type=int, default=0, help="Zusätzliche simulierte Rechner, die Pakete direkt schicken")
+    fleet.add_argument("--load-batches", type=int, default=20, help="Pakete pro simuliertem Rechner")
+    fleet.add_argument("--load-samples", type=int, default=300, help="Messungen pro Paket der simulierten Rechner")
+    args = parser.parse_args()
+    modes = {'bench': run_bench, 'soak': run_soak, 'fleet': run_fleet}
+    sys.exit(modes[args.mode](args))
+
+if __name__ == "__main__":
+    main()
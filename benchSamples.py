@@ -0,0 +1,87 @@
+import argparse
+import csv
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import monitor
+from monitor import GpuReading, SampleStore, read_samples, log_to_csv
+
+# Vergleicht den binären Messspeicher mit CSV-Dateien: Dateigröße, Schreibkosten und Lesen eines Zeitbereichs
+
+def make_samples(count, gpu_count, interval):
+    start = datetime(2024, 1, 1)
+    for i in range(count):
+        gpu_usage = tuple(GpuReading(device, (i * 7 + device * 13) % 101, 1024.0, 8192.0, None, f"00000000:0{device}:00.0")
+                          for device in range(gpu_count))
+        yield start + timedelta(seconds=i * interval), (i * 3) % 100, 50.0, gpu_usage
+
+def write_binary(log_dir, samples):
+    store = SampleStore(log_dir)
+    started = time.perf_counter()
+    for timestamp, cpu_usage, ram_usage, gpu_usage in samples:
+        store.append(timestamp.timestamp(), cpu_usage, ram_usage, gpu_usage)
+    store.close()
+    return time.perf_counter() - started
+
+def write_csv(log_dir, samples):
+    headers = ["Timestamp", "CPU Usage", "RAM Usage", "GPU Devices"]
+    started = time.perf_counter()
+    for timestamp, cpu_usage, ram_usage, gpu_usage in samples:
+        log_file = log_dir / f"samples_{timestamp.strftime('%Y-%m-%d')}.csv"
+        log_to_csv(log_file, [timestamp, cpu_usage, ram_usage, [reading.utilization for reading in gpu_usage]], headers)
+    return time.perf_counter() - started
+
+def read_csv_range(log_dir, start_time, end_time):
+    rows = []
+    for log_file in sorted(log_dir.glob('samples_*.csv')):
+        with open(log_file, 'r') as file:
+            for row in csv.DictReader(file):
+                timestamp = datetime.fromisoformat(row['Timestamp'])
+                if start_time <= timestamp < end_time:
+                    rows.append(row)
+    return rows
+
+def measure(function, *args, repeat=5):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark: binärer Messspeicher gegen CSV")
+    parser.add_argument("--days", type=int, default=1, help="Anzahl simulierter Tage")
+    parser.add_argument("--gpus", type=int, default=1, help="Anzahl GPUs")
+    parser.add_argument("--interval", type=float, default=5, help="Messintervall in Sekunden")
+    args = parser.parse_args()
+
+    count = int(args.days * 86400 / args.interval)
+    samples = list(make_samples(count, args.gpus, args.interval))
+    monitor.CONFIG = {}
+
+    with tempfile.TemporaryDirectory() as binary_dir, tempfile.TemporaryDirectory() as csv_dir:
+        binary_dir, csv_dir = Path(binary_dir), Path(csv_dir)
+        binary_write = write_binary(binary_dir, samples)
+        csv_write = write_csv(csv_dir, samples)
+        binary_size = sum(path.stat().st_size for path in binary_dir.glob('*.bin'))
+        csv_size = sum(path.stat().st_size for path in csv_dir.glob('*.csv'))
+
+        # Eine Stunde aus der Mitte des Zeitraums lesen
+        start_time = samples[len(samples) // 2][0]
+        end_time = start_time + timedelta(hours=1)
+        binary_read, binary_rows = measure(read_samples, start_time, end_time, binary_dir)
+        csv_read, csv_rows = measure(read_csv_range, csv_dir, start_time, end_time)
+
+    print(f"{count} Messungen, {args.gpus} GPU(s), {args.days} Tag(e)")
+    print(f"{'':<22}{'binär':>12}{'CSV':>12}")
+    print(f"{'Dateigröße (KB)':<22}{binary_size / 1024:>12.1f}{csv_size / 1024:>12.1f}")
+    print(f"{'Schreiben (µs/Messung)':<22}{binary_write / count * 1e6:>12.1f}{csv_write / count * 1e6:>12.1f}")
+    print(f"{'Lesen 1h (ms)':<22}{binary_read * 1000:>12.2f}{csv_read * 1000:>12.2f}")
+    print(f"{'Gelesene Messungen':<22}{len(binary_rows):>12}{len(csv_rows):>12}")
+
+if __name__ == "__main__":
+    main()
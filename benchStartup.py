@@ -0,0 +1,81 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+# Misst Importzeit und Speicherbedarf von monitor.py: nur die Module für den Headless-Betrieb gegenüber
+# zusätzlich geladenen Tray-, Bild-, Telegram- und HTTP-Modulen (wie früher bei jedem Start).
+# Außerdem die Prüfung auf eine laufende Instanz: Sperrdatei gegenüber Suche in der Prozessliste.
+
+SCRIPT_DIR = Path(__file__).parent
+
+IMPORT_SNIPPET = """
+import json, time
+started = time.perf_counter()
+import monitor
+{extra}
+elapsed = time.perf_counter() - started
+import psutil
+print(json.dumps({{'seconds': elapsed, 'rss': psutil.Process().memory_info().rss, 'modules': len(__import__('sys').modules)}}))
+"""
+
+INSTANCE_SNIPPET = """
+import json, sys, time
+from pathlib import Path
+import psutil
+import monitor
+# Eigene Sperrdatei, damit die Messung nicht mit einer laufenden Instanz konkurriert
+monitor.get_lock_path = lambda: Path(sys.argv[1])
+started = time.perf_counter()
+monitor.acquire_instance_lock()
+lock_seconds = time.perf_counter() - started
+
+started = time.perf_counter()
+for process in psutil.process_iter(['name', 'cmdline']):
+    try:
+        'monitor.py' in ' '.join(process.info['cmdline'] or [])
+    except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+        pass
+scan_seconds = time.perf_counter() - started
+print(json.dumps({'lock': lock_seconds, 'scan': scan_seconds}))
+"""
+
+EAGER_IMPORTS = "import pystray, PIL.Image, telebot, requests"
+
+def run_snippet(snippet, *args):
+    result = subprocess.run([sys.executable, '-c', snippet, *args], cwd=SCRIPT_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return json.loads(result.stdout)
+
+def measure_imports(extra, repeat):
+    results = [run_snippet(IMPORT_SNIPPET.format(extra=extra)) for _ in range(repeat)]
+    return (statistics.median(result['seconds'] for result in results),
+            statistics.median(result['rss'] for result in results),
+            results[0]['modules'])
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark: Startzeit und Speicherbedarf von monitor.py")
+    parser.add_argument("--repeat", type=int, default=5, help="Anzahl der Durchläufe (Median)")
+    args = parser.parse_args()
+
+    print(f"{'':<28}{'Import (ms)':>14}{'RSS (MB)':>12}{'Module':>10}")
+    for label, extra in (("Headless (lazy)", ""), ("Mit Tray/Telegram/HTTP", EAGER_IMPORTS)):
+        try:
+            seconds, rss, modules = measure_imports(extra, args.repeat)
+        except RuntimeError as e:
+            print(f"{label:<28}nicht messbar: {e}")
+            continue
+        print(f"{label:<28}{seconds * 1000:>14.1f}{rss / 1024 / 1024:>12.1f}{modules:>10}")
+
+    with tempfile.TemporaryDirectory() as lock_dir:
+        instance = run_snippet(INSTANCE_SNIPPET, str(Path(lock_dir) / 'gpu_monitor.lock'))
+    print()
+    print(f"{'Sperrdatei (ms)':<28}{instance['lock'] * 1000:>14.2f}")
+    print(f"{'Prozessliste (ms)':<28}{instance['scan'] * 1000:>14.2f}")
+
+if __name__ == "__main__":
+    main()
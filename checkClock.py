@@ -0,0 +1,153 @@
+import argparse
+import random
+import sys
+from datetime import datetime, timedelta
+
+from monitor import MonitorClock, TickScheduler, step_session
+
+# Prüft MonitorClock und TickScheduler mit einer simulierten Uhr: keine echte Wartezeit, jeder Lauf ist
+# mit demselben --seed wiederholbar. Die Arbeit eines Durchlaufs und Sprünge der Wanduhr werden vorgegeben.
+
+class FakeClock:
+    def __init__(self):
+        self.time = 1000.0
+        self.wall_offset = 0.0
+
+    def monotonic(self):
+        return self.time
+
+    def wall(self):
+        return datetime(2024, 3, 31, 1, 0) + timedelta(seconds=self.time + self.wall_offset)
+
+    def epoch(self):
+        # Sekunden seit der Epoche ändern sich bei der Zeitumstellung nicht, nur die lokale Wanduhr springt
+        return 1711846800 + self.time
+
+    def sleep(self, seconds):
+        self.time += seconds
+
+    def work(self, seconds):
+        self.time += seconds
+
+def check_drift(ticks, interval, rng):
+    # Die Arbeit eines Durchlaufs (bis knapp unter das Intervall) darf die Termine nicht verschieben
+    fake = FakeClock()
+    scheduler = TickScheduler(fake.monotonic, fake.sleep)
+    # Der erste Termin ergibt sich aus dem ersten Aufruf, alle weiteren liegen genau ein Intervall auseinander
+    scheduler.wait(interval)
+    start = fake.monotonic()
+    worst = 0
+    for tick in range(ticks):
+        worst = max(worst, abs(fake.monotonic() - (start + tick * interval)))
+        fake.work(rng.uniform(0, 0.9 * interval))
+        scheduler.wait(interval)
+    return [
+        ("Abweichung vom Termin nach %d Durchläufen" % ticks, worst < 1e-6, f"{worst:.2e}s"),
+        ("keine verpassten Termine", scheduler.missed == 0, scheduler.missed),
+    ]
+
+def check_overruns(ticks, interval, rng):
+    # Zu lange Durchläufe zählen als verpasst und werden nicht nachgeholt: danach geht es sofort weiter
+    # und wieder im normalen Abstand, ohne mehrere Durchläufe direkt hintereinander
+    fake = FakeClock()
+    scheduler = TickScheduler(fake.monotonic, fake.sleep)
+    overruns = 0
+    bursts = 0
+    last_start = None
+    overrun_before = False
+    for tick in range(ticks):
+        started = fake.monotonic()
+        if last_start is not None and not overrun_before and started - last_start < interval - 1e-9:
+            bursts += 1
+        last_start = started
+        overrun_before = rng.random() < 0.1
+        if overrun_before:
+            overruns += 1
+            fake.work(interval * rng.uniform(1.1, 4))
+        else:
+            fake.work(rng.uniform(0, 0.5 * interval))
+        scheduler.wait(interval)
+    return [
+        ("verpasste Termine gezählt", scheduler.missed == overruns, f"{scheduler.missed} von {overruns}"),
+        ("kein Nachholen nach zu langen Durchläufen", bursts == 0, bursts),
+    ]
+
+def check_stop(interval):
+    # Ein Stoppsignal während eines langen Intervalls beendet das Warten nach spätestens einer Sekunde
+    fake = FakeClock()
+    scheduler = TickScheduler(fake.monotonic, fake.sleep)
+    started = fake.monotonic()
+    stop_at = started + 2.5
+    scheduler.wait(interval, lambda: fake.monotonic() >= stop_at)
+    waited = fake.monotonic() - started
+    return [("Reaktion auf Stopp bei %gs Intervall" % interval, waited <= 3.5, f"{waited:.1f}s")]
+
+def check_wake(interval):
+    # Ein Anstieg im Leerlauf beendet das lange Intervall nach spätestens einer Sekunde, das nächste zählt ab dann
+    fake = FakeClock()
+    scheduler = TickScheduler(fake.monotonic, fake.sleep)
+    started = fake.monotonic()
+    wake_at = started + 3.2
+    scheduler.wait(interval, lambda: fake.monotonic() >= wake_at)
+    woken = fake.monotonic()
+    scheduler.wait(interval)
+    return [
+        ("Wecken im Leerlauf bei %gs Intervall" % interval, woken - wake_at <= 1, f"{woken - started:.1f}s"),
+        ("nächster Termin ab dem Wecken", abs(fake.monotonic() - (woken + interval)) < 1e-6, f"{fake.monotonic() - woken:.1f}s"),
+    ]
+
+def run_session(jump):
+    # Eine GPU ist 20 Durchläufe ausgelastet, nach 10 Durchläufen springt die Wanduhr um `jump` Sekunden
+    fake = FakeClock()
+    clock = MonitorClock(fake.monotonic, fake.wall, fake.epoch)
+    threshold, cool_down_period = 50, timedelta(seconds=3)
+    session_start = cool_down = None
+    closed = []
+    times = []
+    stamps = []
+    for tick in range(40):
+        if tick == 10:
+            fake.wall_offset += jump
+        current_time = clock.tick(session_start is not None)
+        times.append(current_time)
+        stamps.append(clock.timestamp())
+        utilization = 90 if 5 <= tick < 25 else 0
+        new_start, new_cool_down, event = step_session(session_start, cool_down, current_time, utilization, threshold, cool_down_period)
+        if event == 'close':
+            closed.append((cool_down - session_start).total_seconds())
+        session_start, cool_down = new_start, new_cool_down
+        fake.sleep(1)
+    return closed, times, stamps, abs((fake.wall() - clock.now()).total_seconds())
+
+def check_resync(jump):
+    closed, times, stamps, offset = run_session(jump)
+    reference, _, _, _ = run_session(0)
+    steady = all(abs((later - earlier).total_seconds() - 1) < 1e-6 for earlier, later in zip(times[5:28], times[6:29]))
+    # Die Messdateien setzen steigende Zeitstempel voraus, auch über die Übernahme der Wanduhr hinweg
+    increasing = all(abs(later - earlier - 1) < 1e-6 for earlier, later in zip(stamps, stamps[1:]))
+    return [
+        ("Sitzungsdauer bei Sprung der Wanduhr um %+ds" % jump, closed == reference == [20.0], f"{closed} / {reference}"),
+        ("kein Sprung der Zeitstempel während der Sitzung", steady, ''),
+        ("Wanduhr nach der Sitzung übernommen", offset < 1e-6, f"{offset:.2e}s"),
+        ("Zeitstempel der Messungen ohne Sprung", increasing, ''),
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description="Prüft Zeitbasis und Taktgeber der Hauptschleife mit einer simulierten Uhr")
+    parser.add_argument("--ticks", type=int, default=100000, help="Anzahl simulierter Durchläufe")
+    parser.add_argument("--interval", type=float, default=5, help="Intervall in Sekunden")
+    parser.add_argument("--seed", type=int, default=0, help="Startwert für die Zufallsdaten")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = (check_drift(args.ticks, args.interval, rng) + check_overruns(args.ticks, args.interval, rng) +
+               check_stop(args.interval) + check_stop(3600) + check_wake(20) + check_resync(3600) + check_resync(-3600))
+    failures = 0
+    for name, ok, detail in results:
+        print(f"{'OK    ' if ok else 'FEHLER'} {name} {detail}")
+        failures += not ok
+    print("Taktgeber: OK" if not failures else f"Taktgeber: {failures} Fehler")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import argparse
+import csv
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import monitor
+from benchMonitor import install_fake_nvidia_smi
+
+# Prüft den nvidia-smi-Sampler (gpu_sampler_loop) gegen fakeNvidiaSmi.py mit einer festen Auslastung:
+# Zusammenfassen der Zeilen eines Intervalls zu einer Messung, Neustart nach dem Ende des Prozesses und
+# veraltete Messungen, wenn nvidia-smi hängt. Nur unter Linux und macOS (nvidia-smi wird durch ein Shell-Skript ersetzt).
+
+TRACE_ROWS = 50
+
+def trace_values(row, gpu_count):
+    # GPU 0 kennzeichnet die Zeile, die anderen GPUs lassen sich daraus berechnen; GPU 1 ist ab und zu nicht verfügbar
+    return [row if device == 0 else (None if device == 1 and row % 7 == 3 else (row * 3 + device * 11) % 101) for device in range(gpu_count)]
+
+def write_trace(path, gpu_count):
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow([f"GPU {device}" for device in range(gpu_count)])
+        for row in range(TRACE_ROWS):
+            writer.writerow(['' if value is None else value for value in trace_values(row, gpu_count)])
+
+def run_sampler(seconds, poll=0.01):
+    # Startet den Sampler wie die Hauptschleife. Gesammelt wird jede veröffentlichte Messung (auch solche, die
+    # gleich wieder ersetzt werden) und, was get_gpu_usage() beim regelmäßigen Abfragen liefert (None für keine Messung).
+    published = []
+    publish_gpu_usage = monitor.publish_gpu_usage
+
+    def record(gpu_usage):
+        published.append(gpu_usage)
+        publish_gpu_usage(gpu_usage)
+
+    monitor.publish_gpu_usage = record
+    monitor.should_stop = False
+    thread = threading.Thread(target=monitor.gpu_sampler_loop, daemon=True)
+    thread.start()
+    observed = []
+    pids = []
+    try:
+        ended = time.monotonic() + seconds
+        while time.monotonic() < ended:
+            observed.append((time.monotonic(), monitor.get_gpu_usage()))
+            for process in list(monitor.nvidia_smi_processes):
+                if process.pid not in pids:
+                    pids.append(process.pid)
+            time.sleep(poll)
+    finally:
+        monitor.should_stop = True
+        monitor.stop_gpu_sampler()
+        thread.join(5)
+        monitor.publish_gpu_usage = publish_gpu_usage
+    return published, observed, pids, not thread.is_alive()
+
+def is_consistent(gpu_usage, gpu_count):
+    indices = [reading.index for reading in gpu_usage]
+    return indices == list(range(gpu_count)) and [reading.utilization for reading in gpu_usage] == trace_values(gpu_usage[0].utilization, gpu_count)
+
+def check_grouping(gpu_count, seconds):
+    published, _, _, stopped = run_sampler(seconds)
+    readings = [gpu_usage for gpu_usage in published if gpu_usage is not None]
+    broken = [gpu_usage for gpu_usage in readings if not is_consistent(gpu_usage, gpu_count)]
+    rows = {gpu_usage[0].utilization for gpu_usage in readings}
+    return [
+        ("Messungen aus %d Zeilen pro Intervall zusammengefasst" % gpu_count, bool(readings) and not broken, f"{len(broken)} von {len(readings)} fehlerhaft"),
+        ("fortlaufende Intervalle gelesen", len(rows) >= seconds * 5, f"{len(rows)} verschiedene"),
+        ("nicht verfügbare Werte als None", any(len(gpu_usage) > 1 and gpu_usage[1].utilization is None for gpu_usage in readings), ''),
+        ("Sampler beendet sich beim Stopp", stopped, ''),
+    ]
+
+def check_restart(gpu_count):
+    # nvidia-smi endet nach 10 Intervallen; der Sampler meldet keine Messung und startet nach einer Sekunde neu
+    os.environ['FAKE_NVIDIA_SMI_EXIT_AFTER'] = '10'
+    try:
+        published, observed, pids, stopped = run_sampler(4)
+    finally:
+        del os.environ['FAKE_NVIDIA_SMI_EXIT_AFTER']
+    gaps = sum(1 for (_, before), (_, after) in zip(observed, observed[1:]) if before is not None and after is None)
+    readings = [gpu_usage for gpu_usage in published if gpu_usage is not None]
+    return [
+        ("Neustart nach dem Ende von nvidia-smi", len(pids) >= 2, f"{len(pids)} Prozesse"),
+        ("keine Messung zwischen zwei Prozessen", gaps >= 1, f"{gaps} Lücken"),
+        ("Messungen nach dem Neustart vollständig", all(is_consistent(gpu_usage, gpu_count) for gpu_usage in readings), ''),
+        ("Sampler beendet sich beim Stopp", stopped, ''),
+    ]
+
+def check_stale(gpu_count):
+    # nvidia-smi hängt nach 5 Intervallen: die letzte Messung gilt nach max(3 Intervalle, 10 s) als veraltet,
+    # gleichzeitig wird der Prozess abgebrochen und nach einer Sekunde neu gestartet
+    os.environ['FAKE_NVIDIA_SMI_STALL_AFTER'] = '5'
+    try:
+        published, observed, pids, stopped = run_sampler(14)
+    finally:
+        del os.environ['FAKE_NVIDIA_SMI_STALL_AFTER']
+    started = observed[0][0]
+    seen = False
+    stale_at = None
+    for timestamp, gpu_usage in observed:
+        if gpu_usage is not None:
+            seen = True
+        elif seen:
+            stale_at = timestamp
+            break
+    stale_after = None if stale_at is None else stale_at - started
+    recovered = stale_at is not None and any(gpu_usage is not None for timestamp, gpu_usage in observed if timestamp > stale_at)
+    readings = [gpu_usage for gpu_usage in published if gpu_usage is not None]
+    return [
+        ("letzte Messung veraltet nach etwa 10 s", stale_after is not None and 9.5 <= stale_after <= 11.5, f"{stale_after:.1f}s" if stale_after else ''),
+        ("Neustart eines hängenden Prozesses", len(pids) >= 2, f"{len(pids)} Prozesse"),
+        ("Messungen nach dem Neustart", recovered and all(is_consistent(gpu_usage, gpu_count) for gpu_usage in readings), ''),
+        ("Sampler beendet sich beim Stopp", stopped, ''),
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description="Prüft den nvidia-smi-Sampler mit fakeNvidiaSmi.py")
+    parser.add_argument("--gpus", type=int, default=3, help="Anzahl simulierter GPUs")
+    parser.add_argument("--interval", type=int, default=100, help="SAMPLE_INTERVAL_MS")
+    parser.add_argument("--duration", type=float, default=3, help="Laufzeit der Prüfung auf Zusammenfassung in Sekunden")
+    args = parser.parse_args()
+    if sys.platform == 'win32':
+        print("Die Prüfung benötigt ein POSIX-System (nvidia-smi wird durch ein Shell-Skript ersetzt).")
+        return 1
+    if args.gpus < 2:
+        parser.error("--gpus muss mindestens 2 sein")
+
+    # Fehler des Samplers (Ende von nvidia-smi) gehören zur Prüfung und werden nicht ausgegeben
+    logging.disable(logging.CRITICAL)
+    monitor.CONFIG = {'CHECK_INTERVAL': args.interval / 1000, 'SAMPLE_INTERVAL_MS': args.interval}
+    with tempfile.TemporaryDirectory() as work_dir:
+        work_dir = Path(work_dir)
+        install_fake_nvidia_smi(work_dir)
+        write_trace(work_dir / 'trace.csv', args.gpus)
+        os.environ['PATH'] = f"{work_dir}{os.pathsep}{os.environ['PATH']}"
+        os.environ['FAKE_NVIDIA_SMI_TRACE'] = str(work_dir / 'trace.csv')
+        results = check_grouping(args.gpus, args.duration) + check_restart(args.gpus) + check_stale(args.gpus)
+
+    failures = 0
+    for name, ok, detail in results:
+        print(f"{'OK    ' if ok else 'FEHLER'} {name} {detail}")
+        failures += not ok
+    print("Sampler: OK" if not failures else f"Sampler: {failures} Fehler")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
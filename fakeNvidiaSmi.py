@@ -0,0 +1,111 @@
+import csv
+import math
+import os
+import random
+import sys
+import time
+
+# Ersatz für nvidia-smi in Benchmarks und Tests ohne NVIDIA-GPU. Versteht die Aufrufe von monitor.py
+# (--query-gpu / --query-compute-apps, --format=csv,noheader,nounits, -lms) und gibt entweder eine
+# aufgezeichnete Auslastung wieder oder erzeugt eine synthetische.
+#
+# Umgebungsvariablen:
+#   FAKE_NVIDIA_SMI_TRACE  CSV mit Spalten "GPU 0", "GPU 1", ... (z.B. aus monitor.py --export-samples),
+#                          eine Zeile pro Intervall, wird in einer Schleife abgespielt
+#   FAKE_NVIDIA_SMI_GPUS   Anzahl synthetischer GPUs (Standard 1)
+#   FAKE_NVIDIA_SMI_SEED   Startwert für die synthetische Auslastung (Standard 0)
+#   FAKE_NVIDIA_SMI_PID    PID, die als GPU-Prozess gemeldet wird (Standard: Elternprozess)
+#   FAKE_NVIDIA_SMI_EXIT_AFTER   nach so vielen Intervallen mit Code 1 beenden (Neustart des Samplers prüfen)
+#   FAKE_NVIDIA_SMI_STALL_AFTER  nach so vielen Intervallen nichts mehr ausgeben, aber weiterlaufen
+
+def load_trace(path):
+    with open(path, 'r', newline='') as file:
+        reader = csv.DictReader(file)
+        columns = [column for column in reader.fieldnames if column.startswith('GPU ')]
+        return [[None if row[column] in ('', 'None') else float(row[column]) for column in columns] for row in reader]
+
+def synthetic_trace(gpu_count, seed):
+    # Abwechselnd Last- und Ruhephasen unterschiedlicher Länge je GPU, mit Rauschen und gelegentlichen Spitzen
+    rng = random.Random(seed)
+    phases = [(rng.randint(20, 200), rng.randint(20, 200), rng.uniform(0, 2 * math.pi)) for _ in range(gpu_count)]
+    step = 0
+    while True:
+        values = []
+        for busy, idle, offset in phases:
+            position = (step + int(offset * 50)) % (busy + idle)
+            base = rng.uniform(60, 100) if position < busy else rng.uniform(0, 15)
+            if rng.random() < 0.01:
+                base = rng.uniform(30, 100)
+            values.append(round(base))
+        yield values
+        step += 1
+
+def iter_trace():
+    trace_path = os.environ.get('FAKE_NVIDIA_SMI_TRACE')
+    if trace_path:
+        rows = load_trace(trace_path)
+        while rows:
+            yield from rows
+    else:
+        yield from synthetic_trace(int(os.environ.get('FAKE_NVIDIA_SMI_GPUS', '1')), int(os.environ.get('FAKE_NVIDIA_SMI_SEED', '0')))
+
+def format_value(value):
+    return '[N/A]' if value is None else f"{value:g}"
+
+def gpu_lines(values):
+    for index, utilization in enumerate(values):
+        fields = {
+            'index': str(index),
+            'utilization.gpu': format_value(utilization),
+            'memory.used': format_value(None if utilization is None else 512 + utilization * 70),
+            'memory.total': '8192',
+            'power.draw': format_value(None if utilization is None else 30 + utilization * 2.2),
+            'pci.bus_id': f"00000000:{index + 1:02X}:00.0",
+        }
+        yield fields
+
+def main():
+    args = sys.argv[1:]
+    query = next((arg for arg in args if arg.startswith('--query-')), None)
+    if query is None:
+        print("NVIDIA-SMI (fake) - nur --query-gpu und --query-compute-apps werden unterstützt")
+        return
+    kind, fields = query[len('--query-'):].split('=', 1)
+    fields = fields.split(',')
+    interval_ms = int(args[args.index('-lms') + 1]) if '-lms' in args else 0
+    pid = int(os.environ.get('FAKE_NVIDIA_SMI_PID', os.getppid()))
+    exit_after = int(os.environ.get('FAKE_NVIDIA_SMI_EXIT_AFTER', '0'))
+    stall_after = int(os.environ.get('FAKE_NVIDIA_SMI_STALL_AFTER', '0'))
+
+    trace = iter_trace()
+    next_time = time.monotonic()
+    step = 0
+    while True:
+        if exit_after and step >= exit_after:
+            sys.exit(1)
+        if stall_after and step >= stall_after:
+            while True:
+                time.sleep(1)
+        step += 1
+        values = next(trace)
+        lines = []
+        for gpu in gpu_lines(values):
+            if kind == 'gpu':
+                lines.append(", ".join(gpu[field] for field in fields))
+            elif (values[int(gpu['index'])] or 0) > 20:
+                # Ausgelastete GPUs melden den Elternprozess (also monitor.py) als Rechenprozess
+                app = {'gpu_bus_id': gpu['pci.bus_id'], 'pid': str(pid), 'used_memory': gpu['memory.used']}
+                lines.append(", ".join(app.get(field, '[N/A]') for field in fields))
+        try:
+            if lines:
+                sys.stdout.write("\n".join(lines) + "\n")
+            sys.stdout.flush()
+        except BrokenPipeError:
+            return
+        if not interval_ms:
+            return
+        next_time += interval_ms / 1000
+        time.sleep(max(next_time - time.monotonic(), 0))
+
+if __name__ == "__main__":
+    main()
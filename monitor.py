@@ -6,20 +6,28 @@ import time
 from datetime import datetime, timedelta
 import csv
 import json
-import requests
 from pathlib import Path
 import logging
 from logging.handlers import RotatingFileHandler
-import telebot
-from telebot.formatting import escape_markdown
 import traceback
-from collections import defaultdict
+from collections import defaultdict, namedtuple, deque
+from types import MappingProxyType
 import signal
 import shutil
+import tempfile
 import argparse
-import pystray
-from PIL import Image
 import threading
+import queue
+import heapq
+import bisect
+import functools
+import struct
+import mmap
+import gzip
+import hashlib
+import webbrowser
+import socket
+from urllib.parse import urlparse, parse_qs
 
 # Globale Variablen
 CONFIG = None
@@ -28,24 +36,131 @@ last_reset_date = None
 filtered_total = 0
 should_stop = False
 last_log_time = datetime.now()
-gpu_usage_start = None
-cool_down_start = None
+gpu_usage_start = {}
+cool_down_start = {}
 logging_active = False
+device_totals = {}
+usage_log_sizes = {}
+ledger_lock = threading.Lock()
+user_totals = {}
+rollups = None
+live_samples = None
+session_journal = None
+latest_snapshot = None
+snapshot_condition = threading.Condition()
+icon_images = {}
+icon = None
+instance_lock_file = None
+http_server = None
+nvidia_smi_processes = []
+latest_gpu_usage = None
+latest_gpu_usage_time = None
+latest_compute_apps = ()
+latest_compute_apps_time = None
+gpu_sample_lock = threading.Lock()
 
-# Konfiguration speichern
-def save_config():
-    config_path = Path(__file__).parent / 'config.json'
-    with open(config_path, 'w') as config_file:
-        json.dump(CONFIG, config_file, indent=4, default=str)
-    
-    # Create settings.json in the log directory
-    settings = {
-        'LOG_DIR': str(CONFIG['LOG_DIR']),
-        'last_reset_date': CONFIG['last_reset_date']
-    }
-    settings_path = CONFIG['LOG_DIR'] / 'settings.json'
-    with open(settings_path, 'w') as settings_file:
-        json.dump(settings, settings_file, indent=4)
+GPU_QUERY_FIELDS = ['index', 'utilization.gpu', 'memory.used', 'memory.total', 'power.draw', 'pci.bus_id']
+GpuReading = namedtuple('GpuReading', ['index', 'utilization', 'memory_used', 'memory_total', 'power_draw', 'bus_id'])
+COMPUTE_APP_QUERY_FIELDS = ['gpu_bus_id', 'pid', 'used_memory']
+ComputeApp = namedtuple('ComputeApp', ['bus_id', 'pid', 'used_memory'])
+
+STATE_FLUSH_DELAY = 2
+NOTIFY_QUEUE_SIZE = 100
+NOTIFY_TIMEOUT = 10
+NOTIFY_MAX_RETRIES = 5
+NOTIFY_COALESCE_DELAY = 1
+TELEGRAM_MAX_MESSAGE_LENGTH = 4000
+NOTION_BATCH_SIZE = 20
+TOP_PROCESS_COUNT = 5
+SAMPLE_FILE_MAGIC = b'GPUS'
+SAMPLE_FILE_VERSION = 1
+SAMPLE_HEADER = struct.Struct('<4sHH')
+SAMPLE_NO_VALUE = 255
+ROLLUP_RESOLUTIONS = ['minute', 'hour', 'day']
+ROLLUP_STEPS = {'minute': timedelta(minutes=1), 'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+CSV_CACHE_SIZE = 64
+LIVE_BUFFER_HOURS = 6
+LIVE_DEFAULT_POINTS = 500
+LIVE_PEAK_WINDOW = 300
+JOURNAL_FSYNC_INTERVAL = 5
+JOURNAL_HEARTBEAT_INTERVAL = 30
+ADAPTIVE_MARGIN = 10
+CLOCK_RESYNC_THRESHOLD = 1
+LATENCY_BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+SLOW_TICK_FRACTION = 0.5
+REGULAR_LOG_HEADERS = ["Timestamp", "GPU Usage", "CPU Usage", "RAM Usage", "Disk Usage", "Top Processes", "GPU Devices", "GPU Processes"]
+USAGE_LOG_HEADERS = ["Start Time", "End Time", "Duration (seconds)", "GPU", "GPU Total (seconds)"]
+ATTRIBUTION_LOG_HEADERS = ["Start Time", "End Time", "GPU", "PID", "Process Start", "User", "Command", "GPU Seconds"]
+LOG_COMPACTION_INTERVAL = 3600
+FLEET_PORT = 8770
+FLEET_PUSH_INTERVAL = 30
+FLEET_BATCH_SIZE = 1000
+FLEET_MAX_PENDING_SAMPLES = 20000
+FLEET_MAX_BACKOFF = 300
+FLEET_MAX_BODY = 16 * 1024 * 1024
+FLEET_IDLE_TIMEOUT = 60
+ROLLUP_HEADERS = ["Timestamp", "Min Usage", "Max Usage", "Mean Usage", "CPU Usage", "RAM Usage", "Busy Seconds", "Sessions", "Samples"]
+
+# Laufzeitzustand (z.B. last_reset_date), getrennt von der Benutzerkonfiguration in config.json
+state = {}
+state_dirty = False
+state_flush_timer = None
+state_lock = threading.Lock()
+
+def write_json_atomic(path, data):
+    # Erst in eine temporäre Datei schreiben und dann umbenennen, damit ein Absturz nie eine halbe Datei hinterlässt
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w') as tmp_file:
+        json.dump(data, tmp_file, indent=4, default=str)
+        tmp_file.flush()
+        os.fsync(tmp_file.fileno())
+    os.replace(tmp_path, path)
+
+def get_state_path(log_dir=None):
+    # settings.json im Log-Verzeichnis wird auch vom Dashboard gelesen
+    return (log_dir or CONFIG['LOG_DIR']) / 'settings.json'
+
+def load_state(config):
+    global state
+    try:
+        with open(get_state_path(config['LOG_DIR']), 'r') as state_file:
+            state = json.load(state_file)
+    except FileNotFoundError:
+        state = {}
+    except ValueError as e:
+        logging.warning(f"settings.json konnte nicht gelesen werden: {str(e)}")
+        state = {}
+    # Ältere Versionen haben last_reset_date in config.json gespeichert
+    state.setdefault('last_reset_date', config.get('last_reset_date', datetime.now().isoformat()))
+    state['LOG_DIR'] = str(config['LOG_DIR'])
+    return state
+
+def set_state(key, value):
+    global state_dirty, state_flush_timer
+    with state_lock:
+        if state.get(key) == value:
+            return
+        state[key] = value
+        state_dirty = True
+        # Mehrere Änderungen kurz hintereinander werden zu einem Schreibvorgang zusammengefasst
+        if state_flush_timer is None:
+            state_flush_timer = threading.Timer(STATE_FLUSH_DELAY, flush_state)
+            state_flush_timer.daemon = True
+            state_flush_timer.start()
+
+def flush_state(force=False):
+    global state_dirty, state_flush_timer
+    with state_lock:
+        if state_flush_timer is not None:
+            state_flush_timer.cancel()
+            state_flush_timer = None
+        if not state_dirty and not force:
+            return
+        try:
+            write_json_atomic(get_state_path(), state)
+            state_dirty = False
+        except Exception as e:
+            log_error(f"Fehler beim Speichern des Zustands: {str(e)}")
 
 # Konfiguration aus JSON-Datei laden
 def load_config():
@@ -61,25 +176,113 @@ def load_config():
     else:
         config['LOG_DIR'] = Path(log_dir)
     
-    last_reset_date = datetime.fromisoformat(config.get('last_reset_date', datetime.now().isoformat()))
+    load_state(config)
+    last_reset_date = datetime.fromisoformat(state['last_reset_date'])
     return config
 
-def send_telegram_message(message, retry_count=0):
-    if not CONFIG.get('ENABLE_TELEGRAM', False):
+# Benachrichtigungen laufen über einen Hintergrund-Thread, damit die Überwachung nie auf das Netzwerk wartet
+notify_queue = queue.Queue(maxsize=NOTIFY_QUEUE_SIZE)
+notify_thread = None
+notify_lock = threading.Lock()
+http_session = None
+
+def get_http_session():
+    # Eine gemeinsame Session hält die Verbindung offen (Keep-Alive), statt für jeden Request neu zu verbinden
+    global http_session
+    if http_session is None:
+        import requests
+        http_session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=4)
+        http_session.mount('https://', adapter)
+        http_session.mount('http://', adapter)
+    return http_session
+
+def enqueue_notification(kind, payload):
+    global notify_thread
+    with notify_lock:
+        if notify_thread is None or not notify_thread.is_alive():
+            notify_thread = threading.Thread(target=notification_loop, daemon=True)
+            notify_thread.start()
+    try:
+        notify_queue.put_nowait((kind, payload))
+    except queue.Full:
+        # Bei voller Warteschlange wird die älteste Benachrichtigung verworfen
+        try:
+            dropped = notify_queue.get_nowait()
+            logging.warning(f"Benachrichtigungswarteschlange voll, verwerfe: {dropped}")
+        except queue.Empty:
+            pass
+        try:
+            notify_queue.put_nowait((kind, payload))
+        except queue.Full:
+            logging.warning(f"Benachrichtigung verworfen: {payload}")
+
+def stop_notifier(timeout=NOTIFY_TIMEOUT):
+    # Noch ausstehende Benachrichtigungen zustellen, aber höchstens `timeout` Sekunden warten
+    if notify_thread is None or not notify_thread.is_alive():
         return
-    if retry_count >= 3:
-        logging.error(f"Failed to send Telegram message after 3 attempts: {message}")
+    try:
+        notify_queue.put(None, timeout=timeout)
+    except queue.Full:
         return
+    notify_thread.join(timeout)
 
-    try:
-        escaped_message = escape_markdown(message)
-        escaped_message = escaped_message.replace("*", "")
-        escaped_message = escaped_message.rstrip('\\')
-        bot.send_message(CONFIG['TELEGRAM_CHAT_ID'], escaped_message, parse_mode='MarkdownV2')
-    except Exception as e:
-        logging.error(f"Error sending Telegram message (attempt {retry_count + 1}): {str(e)}")
-        time.sleep(1)
-        send_telegram_message(message, retry_count + 1)
+def deliver_with_retry(deliver, description):
+    delay = 1
+    for attempt in range(1, NOTIFY_MAX_RETRIES + 1):
+        try:
+            deliver()
+            return True
+        except Exception as e:
+            logging.error(f"Fehler beim Senden von {description} (Versuch {attempt}): {str(e)}")
+            count_event('notify_retry')
+            if attempt < NOTIFY_MAX_RETRIES:
+                time.sleep(delay)
+                delay = min(delay * 2, 60)
+    return False
+
+def notification_loop():
+    pending = None
+    while True:
+        item = pending if pending is not None else notify_queue.get()
+        pending = None
+        if item is None:
+            break
+        kind, payload = item
+        if kind == 'telegram':
+            # Nachrichten, die kurz nacheinander eintreffen, werden zu einer Telegram-Nachricht zusammengefasst
+            messages = [payload]
+            length = len(payload)
+            deadline = time.monotonic() + NOTIFY_COALESCE_DELAY
+            while True:
+                try:
+                    next_item = notify_queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if next_item is None or next_item[0] != 'telegram' or length + len(next_item[1]) > TELEGRAM_MAX_MESSAGE_LENGTH:
+                    pending = next_item
+                    break
+                messages.append(next_item[1])
+                length += len(next_item[1])
+            message = "\n\n".join(messages)
+            if not deliver_with_retry(lambda: post_telegram_message(message), "Telegram-Nachricht"):
+                logging.error(f"Failed to send Telegram message after {NOTIFY_MAX_RETRIES} attempts: {message}")
+        elif kind == 'notion':
+            if not deliver_with_retry(replay_notion_spool, "Notion-Einträgen"):
+                log_error(f"Fehler beim Aktualisieren von Notion nach {NOTIFY_MAX_RETRIES} Versuchen, "
+                          f"{len(read_notion_spool())} Einträge bleiben im Spool")
+
+def post_telegram_message(message):
+    from telebot.formatting import escape_markdown
+    escaped_message = escape_markdown(message)
+    escaped_message = escaped_message.replace("*", "")
+    escaped_message = escaped_message.rstrip('\\')
+    bot.send_message(CONFIG['TELEGRAM_CHAT_ID'], escaped_message, parse_mode='MarkdownV2', timeout=NOTIFY_TIMEOUT)
+
+def send_telegram_message(message):
+    if not CONFIG.get('ENABLE_TELEGRAM', False):
+        return
+    enqueue_notification('telegram', message)
 
 def log_error(error_msg):
     logging.error(error_msg)
@@ -89,135 +292,2503 @@ def log_error(error_msg):
         except Exception as e:
             logging.error(f"Failed to send error message via Telegram: {str(e)}")
 
-def get_gpu_usage():
-    try:
+def get_sample_interval_ms():
+    return int(CONFIG.get('SAMPLE_INTERVAL_MS', get_min_check_interval() * 1000))
+
+def get_subprocess_kwargs():
+    # Unter Windows kein Konsolenfenster für nvidia-smi öffnen
+    kwargs = {}
+    if sys.platform == 'win32':
         startupinfo = subprocess.STARTUPINFO()
         startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-        process = subprocess.Popen(['nvidia-smi', '--query-gpu=utilization.gpu', '--format=csv,noheader,nounits'], 
-                                   stdout=subprocess.PIPE, 
-                                   stderr=subprocess.PIPE, 
-                                   startupinfo=startupinfo)
-        output, error = process.communicate()
-        if process.returncode != 0:
-            raise subprocess.CalledProcessError(process.returncode, process.args, output, error)
-        return int(output.decode('utf-8').strip())
-    except subprocess.CalledProcessError as e:
-        log_error(f"Fehler bei der Ausführung von nvidia-smi: {e.stderr.decode('utf-8')}")
+        kwargs['startupinfo'] = startupinfo
+    return kwargs
+
+def start_nvidia_smi(query, interval_ms):
+    return subprocess.Popen(['nvidia-smi', query, '--format=csv,noheader,nounits', '-lms', str(interval_ms)],
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            universal_newlines=True,
+                            bufsize=1,
+                            **get_subprocess_kwargs())
+
+def parse_gpu_value(value, type_=float):
+    # nvidia-smi liefert z.B. "[N/A]" oder "[Not Supported]", wenn ein Wert nicht verfügbar ist
+    value = value.strip()
+    if value.startswith('['):
         return None
+    return type_(value)
+
+def parse_gpu_line(line):
+    index, utilization, memory_used, memory_total, power_draw, bus_id = line.split(',')
+    return GpuReading(int(index),
+                      parse_gpu_value(utilization, int),
+                      parse_gpu_value(memory_used),
+                      parse_gpu_value(memory_total),
+                      parse_gpu_value(power_draw),
+                      bus_id.strip())
+
+def parse_compute_app_line(line):
+    bus_id, pid, used_memory = line.split(',')
+    return ComputeApp(bus_id.strip(), int(pid), parse_gpu_value(used_memory))
+
+def publish_gpu_usage(gpu_usage):
+    global latest_gpu_usage, latest_gpu_usage_time
+    with gpu_sample_lock:
+        latest_gpu_usage = gpu_usage
+        latest_gpu_usage_time = time.monotonic()
+
+def publish_compute_apps(compute_apps):
+    global latest_compute_apps, latest_compute_apps_time
+    with gpu_sample_lock:
+        latest_compute_apps = compute_apps
+        latest_compute_apps_time = time.monotonic()
+
+def stop_gpu_sampler():
+    for process in list(nvidia_smi_processes):
+        if process.poll() is None:
+            process.terminate()
+
+def get_max_sample_age():
+    return max(3 * get_sample_interval_ms() / 1000, 10)
+
+def watch_nvidia_smi(process, last_line_time, timeout):
+    # Ein hängendes nvidia-smi (z.B. nach einem Xid-Fehler) beendet sich nicht von selbst; ohne Ausgabe
+    # innerhalb von `timeout` Sekunden wird es abgebrochen, damit der normale Neustart greift
+    while process.poll() is None and not should_stop:
+        if time.monotonic() - last_line_time[0] > timeout:
+            logging.warning(f"nvidia-smi liefert seit {timeout:.0f}s keine Werte und wird abgebrochen")
+            process.kill()
+            return
+        time.sleep(0.5)
+
+# Ein einziger nvidia-smi-Prozess im Loop-Modus statt eines neuen Prozesses pro Messung.
+# Jede Zeile der Ausgabe wird an handle_line übergeben; reset() wird vor jedem (Neu-)Start aufgerufen.
+# Mit `timeout` wird der Prozess auch neu gestartet, wenn er so lange keine Zeile ausgibt.
+def stream_nvidia_smi(query, handle_line, reset, timeout=None):
+    restart_delay = 1
+    while not should_stop:
+        reset()
+        process = None
+        try:
+            process = start_nvidia_smi(query, get_sample_interval_ms())
+            nvidia_smi_processes.append(process)
+            last_line_time = [time.monotonic()]
+            if timeout:
+                threading.Thread(target=watch_nvidia_smi, args=(process, last_line_time, timeout), daemon=True).start()
+            for line in process.stdout:
+                last_line_time[0] = time.monotonic()
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    handle_line(line)
+                except ValueError:
+                    logging.warning(f"Unerwartete Ausgabe von nvidia-smi: {line}")
+                    continue
+                restart_delay = 1
+            process.wait()
+            if should_stop:
+                break
+            log_error(f"nvidia-smi wurde unerwartet beendet (Code {process.returncode}): {process.stderr.read().strip()}")
+        except Exception as e:
+            log_error(f"Fehler beim Starten von nvidia-smi: {str(e)}")
+        finally:
+            if process is not None:
+                if process.poll() is None:
+                    process.terminate()
+                nvidia_smi_processes.remove(process)
+        reset()
+
+        # Neustart mit wachsender Wartezeit, damit ein dauerhaft fehlendes nvidia-smi nicht die Logs flutet
+        restart_at = time.monotonic() + restart_delay
+        while not should_stop and time.monotonic() < restart_at:
+            time.sleep(0.5)
+        restart_delay = min(restart_delay * 2, 60)
+
+# nvidia-smi gibt pro Intervall eine Zeile je GPU aus; diese werden zu einer Messung zusammengefasst.
+def gpu_sampler_loop():
+    batch = []
+    gpu_count = None
+
+    def reset():
+        nonlocal gpu_count
+        batch.clear()
+        gpu_count = None
+        publish_gpu_usage(None)
+
+    def handle_line(line):
+        nonlocal gpu_count
+        reading = parse_gpu_line(line)
+        # Solange die Anzahl der GPUs noch unbekannt ist, beginnt eine neue Messung, sobald sich ein Index wiederholt
+        if batch and reading.index <= batch[-1].index:
+            gpu_count = len(batch)
+            publish_gpu_usage(tuple(batch))
+            batch.clear()
+        batch.append(reading)
+        if len(batch) == gpu_count:
+            publish_gpu_usage(tuple(batch))
+            batch.clear()
+
+    stream_nvidia_smi(f"--query-gpu={','.join(GPU_QUERY_FIELDS)}", handle_line, reset, get_max_sample_age())
+
+# Prozesse mit GPU-Kontext für die Zuordnung der GPU-Zeit (ENABLE_ATTRIBUTION). Laufen keine Prozesse,
+# gibt nvidia-smi gar nichts aus; die Zeilen eines Intervalls werden daher über ihren zeitlichen Abstand gruppiert.
+def compute_app_sampler_loop():
+    apps = []
+    last_line_time = None
+
+    def reset():
+        nonlocal last_line_time
+        apps.clear()
+        last_line_time = None
+        publish_compute_apps(())
+
+    def handle_line(line):
+        nonlocal last_line_time
+        app = parse_compute_app_line(line)
+        now = time.monotonic()
+        if last_line_time is None or now - last_line_time > min(get_sample_interval_ms() / 2000, 0.5):
+            apps.clear()
+        last_line_time = now
+        apps.append(app)
+        publish_compute_apps(tuple(apps))
+
+    stream_nvidia_smi(f"--query-compute-apps={','.join(COMPUTE_APP_QUERY_FIELDS)}", handle_line, reset)
+
+def get_gpu_usage():
+    # Liefert die letzte Messung des Samplers (ein GpuReading pro GPU), solange sie nicht veraltet ist
+    max_age = get_max_sample_age()
+    with gpu_sample_lock:
+        if latest_gpu_usage is None or time.monotonic() - latest_gpu_usage_time > max_age:
+            return None
+        return latest_gpu_usage
+
+def get_compute_apps():
+    # Ist die letzte Ausgabe älter als ein Intervall, laufen aktuell keine Prozesse auf der GPU
+    max_age = 1.5 * get_sample_interval_ms() / 1000 + 0.5
+    with gpu_sample_lock:
+        if latest_compute_apps_time is None or time.monotonic() - latest_compute_apps_time > max_age:
+            return ()
+        return latest_compute_apps
+
+def format_gpu_usage(gpu_usage):
+    if not gpu_usage:
+        return "N/A"
+    return " / ".join("N/A" if reading.utilization is None else f"{reading.utilization}%" for reading in gpu_usage)
+
+def get_mean_utilization(gpu_usage):
+    return get_mean_value([reading.utilization for reading in gpu_usage])
+
+def get_mean_value(values):
+    values = [value for value in values if value is not None]
+    return sum(values) / len(values) if values else None
+
+# Prozesstabelle, die über mehrere Abfragen hinweg bestehen bleibt. Nur neue und beendete PIDs
+# werden angepasst, und cpu_percent() liefert so den Durchschnitt seit der letzten Abfrage statt 0.0.
+process_table = {}
+
+def update_process_table():
+    pids = set(psutil.pids())
+    for pid in list(process_table):
+        if pid not in pids:
+            del process_table[pid]
+    for pid in pids.difference(process_table):
+        try:
+            process = psutil.Process(pid)
+            process.cpu_percent()
+            process_table[pid] = process
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            pass
+
+def get_gpu_process_pids():
+    try:
+        output = subprocess.run(['nvidia-smi', '--query-compute-apps=pid', '--format=csv,noheader,nounits'],
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE,
+                                universal_newlines=True,
+                                timeout=10,
+                                check=True,
+                                **get_subprocess_kwargs()).stdout
+        return {int(line) for line in output.split() if line.isdigit()}
     except Exception as e:
-        log_error(f"Unerwarteter Fehler beim Abrufen der GPU-Nutzung: {str(e)}")
+        logging.warning(f"GPU-Prozesse konnten nicht abgefragt werden: {str(e)}")
+        return set()
+
+def get_top_processes(count=TOP_PROCESS_COUNT):
+    update_process_table()
+    usage = []
+    for pid, process in list(process_table.items()):
+        try:
+            usage.append((process.cpu_percent(), pid))
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            del process_table[pid]
+    return heapq.nlargest(count, usage)
+
+def get_process_name(pid):
+    try:
+        return process_table[pid].name()
+    except (KeyError, psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
         return None
 
 def get_system_info():
     try:
+        if CONFIG.get('ENABLE_ATTRIBUTION', False):
+            gpu_pids = {app.pid for app in get_compute_apps()}
+        else:
+            gpu_pids = get_gpu_process_pids()
         return {
             'cpu_usage': psutil.cpu_percent(),
             'ram_usage': psutil.virtual_memory().percent,
             'disk_usage': {disk.mountpoint: psutil.disk_usage(disk.mountpoint).percent for disk in psutil.disk_partitions()},
-            'top_processes': [{'name': p.info['name'], 'cpu_percent': p.info['cpu_percent']} 
-                              for p in sorted(psutil.process_iter(['name', 'cpu_percent']), key=lambda x: x.info['cpu_percent'], reverse=True)[:5]]
+            'top_processes': [{'name': get_process_name(pid), 'pid': pid, 'cpu_percent': cpu_percent, 'gpu': pid in gpu_pids}
+                              for cpu_percent, pid in get_top_processes()],
+            'gpu_processes': [{'name': get_process_name(pid), 'pid': pid} for pid in sorted(gpu_pids)]
         }
     except Exception as e:
         log_error(f"Fehler beim Abrufen der Systeminfo: {str(e)}")
         return None
 
-def log_to_csv(file_path, data, headers=None):
+def log_rows_to_csv(file_path, rows, headers=None):
     try:
         file_exists = file_path.exists()
         with open(file_path, mode='a', newline='') as file:
             writer = csv.writer(file)
             if not file_exists and headers:
                 writer.writerow(headers)
-            writer.writerow(data)
+            writer.writerows(rows)
     except Exception as e:
         log_error(f"Fehler beim Schreiben in CSV-Datei {file_path}: {str(e)}")
 
+def log_to_csv(file_path, data, headers=None):
+    log_rows_to_csv(file_path, [data], headers)
+
 def log_regular_info(timestamp, gpu_usage, system_info):
     date_str = timestamp.strftime("%Y-%m-%d")
     log_file = CONFIG['LOG_DIR'] / f"regular_log_{date_str}.csv"
-    headers = ["Timestamp", "GPU Usage", "CPU Usage", "RAM Usage", "Disk Usage", "Top Processes"]
     data = [
         timestamp,
-        gpu_usage,
+        get_mean_utilization(gpu_usage),
         system_info['cpu_usage'],
         system_info['ram_usage'],
         json.dumps(system_info['disk_usage']),
-        json.dumps(system_info['top_processes'])
+        json.dumps(system_info['top_processes']),
+        json.dumps([reading._asdict() for reading in gpu_usage]),
+        json.dumps(system_info['gpu_processes'])
     ]
-    log_to_csv(log_file, data, headers)
+    log_to_csv(log_file, data, REGULAR_LOG_HEADERS)
+
+# Binärer Speicher für alle Messungen: eine Datei pro Tag mit Datensätzen fester Länge
+# (Zeitstempel, CPU, RAM, Auslastung je GPU). Leser können die Datei per mmap einblenden und
+# Zeitbereiche per Binärsuche ausschneiden, ohne Text zu parsen.
+def get_sample_struct(gpu_count):
+    return struct.Struct(f'<dff{gpu_count}B')
+
+def get_sample_path(log_dir, day):
+    return log_dir / f"samples_{day.strftime('%Y-%m-%d')}.bin"
+
+class SampleStore:
+    def __init__(self, log_dir):
+        self.log_dir = log_dir
+        self.file = None
+        self.day = None
+        self.record = None
+        self.gpu_count = 0
+        self.last_timestamp = None
+        self.behind = False
+
+    def open(self, day, gpu_count):
+        self.close()
+        path = get_sample_path(self.log_dir, day)
+        size = path.stat().st_size if path.exists() else 0
+        if size >= SAMPLE_HEADER.size:
+            # Die Anzahl der GPU-Spalten einer Datei steht im Header und bleibt für den ganzen Tag gleich
+            with open(path, 'rb') as sample_file:
+                magic, version, gpu_count = SAMPLE_HEADER.unpack(sample_file.read(SAMPLE_HEADER.size))
+            if magic != SAMPLE_FILE_MAGIC or version != SAMPLE_FILE_VERSION:
+                raise ValueError(f"Unbekanntes Format der Messdatei {path}")
+            self.record = get_sample_struct(gpu_count)
+            self.file = open(path, 'ab')
+            # Einen unvollständigen Datensatz nach einem Absturz abschneiden
+            partial = (size - SAMPLE_HEADER.size) % self.record.size
+            if partial:
+                self.file.truncate(size - partial)
+            self.last_timestamp = read_last_sample_timestamp(path)
+        else:
+            self.record = get_sample_struct(gpu_count)
+            self.file = open(path, 'wb')
+            self.file.write(SAMPLE_HEADER.pack(SAMPLE_FILE_MAGIC, SAMPLE_FILE_VERSION, gpu_count))
+        self.day = day
+        self.gpu_count = gpu_count
+
+    def append(self, timestamp, cpu_usage, ram_usage, gpu_usage):
+        # timestamp in Sekunden seit der Epoche (MonitorClock.timestamp). Die Leser suchen binär und setzen
+        # steigende Zeitstempel voraus; nach einem Rücksprung der Systemzeit wird bis zum Aufholen nichts geschrieben.
+        day = datetime.fromtimestamp(timestamp).date()
+        if self.day != day:
+            self.open(day, len(gpu_usage))
+        if self.last_timestamp is not None and timestamp <= self.last_timestamp:
+            if not self.behind:
+                logging.warning(f"Systemzeit liegt {self.last_timestamp - timestamp:.1f}s vor der letzten Messung zurück, "
+                                f"Messungen werden bis zum Aufholen nicht gespeichert")
+                self.behind = True
+            return False
+        self.behind = False
+        utilization = [SAMPLE_NO_VALUE if reading.utilization is None else reading.utilization
+                       for reading in gpu_usage[:self.gpu_count]]
+        utilization += [SAMPLE_NO_VALUE] * (self.gpu_count - len(utilization))
+        self.file.write(self.record.pack(timestamp, cpu_usage, ram_usage, *utilization))
+        self.file.flush()
+        self.last_timestamp = timestamp
+        return True
+
+    def close(self):
+        if self.file:
+            self.file.close()
+        self.file = None
+        self.day = None
+        self.last_timestamp = None
+
+def find_sample_index(data, record, count, timestamp):
+    # Binärsuche nach dem ersten Datensatz mit Zeitstempel >= timestamp
+    low, high = 0, count
+    while low < high:
+        middle = (low + high) // 2
+        if struct.unpack_from('<d', data, SAMPLE_HEADER.size + middle * record.size)[0] < timestamp:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+def read_sample_file(path, start_timestamp, end_timestamp):
+    try:
+        sample_file = open(path, 'rb')
+    except FileNotFoundError:
+        return []
+    with sample_file:
+        size = os.fstat(sample_file.fileno()).st_size
+        if size <= SAMPLE_HEADER.size:
+            return []
+        with mmap.mmap(sample_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, version, gpu_count = SAMPLE_HEADER.unpack_from(data, 0)
+            if magic != SAMPLE_FILE_MAGIC or version != SAMPLE_FILE_VERSION:
+                raise ValueError(f"Unbekanntes Format der Messdatei {path}")
+            record = get_sample_struct(gpu_count)
+            count = (size - SAMPLE_HEADER.size) // record.size
+            first = find_sample_index(data, record, count, start_timestamp)
+            last = find_sample_index(data, record, count, end_timestamp)
+            chunk = data[SAMPLE_HEADER.size + first * record.size:SAMPLE_HEADER.size + last * record.size]
+    return [(values[0], values[1], values[2], tuple(None if value == SAMPLE_NO_VALUE else value for value in values[3:]))
+            for values in record.iter_unpack(chunk)]
+
+def read_last_sample_timestamp(path):
+    # Zeitstempel des letzten vollständigen Datensatzes, ohne die ganze Datei zu lesen
+    with open(path, 'rb') as sample_file:
+        header = sample_file.read(SAMPLE_HEADER.size)
+        if len(header) < SAMPLE_HEADER.size:
+            return None
+        magic, version, gpu_count = SAMPLE_HEADER.unpack(header)
+        if magic != SAMPLE_FILE_MAGIC or version != SAMPLE_FILE_VERSION:
+            raise ValueError(f"Unbekanntes Format der Messdatei {path}")
+        record = get_sample_struct(gpu_count)
+        count = (os.fstat(sample_file.fileno()).st_size - SAMPLE_HEADER.size) // record.size
+        if not count:
+            return None
+        sample_file.seek(SAMPLE_HEADER.size + (count - 1) * record.size)
+        return record.unpack(sample_file.read(record.size))[0]
+
+def read_samples(start_time, end_time, log_dir=None):
+    # Liefert (Zeitstempel, CPU, RAM, (Auslastung je GPU)) für start_time <= t < end_time
+    log_dir = log_dir or CONFIG['LOG_DIR']
+    samples = []
+    day = start_time.date()
+    while day <= end_time.date():
+        samples.extend(read_sample_file(get_sample_path(log_dir, day), start_time.timestamp(), end_time.timestamp()))
+        day += timedelta(days=1)
+    return samples
+
+def export_samples_csv(day):
+    start_time = datetime.combine(day, datetime.min.time())
+    samples = read_samples(start_time, start_time + timedelta(days=1))
+    if not samples:
+        return None
+    gpu_count = len(samples[0][3])
+    csv_path = CONFIG['LOG_DIR'] / f"samples_{day.strftime('%Y-%m-%d')}.csv"
+    headers = ["Timestamp", "CPU Usage", "RAM Usage"] + [f"GPU {device}" for device in range(gpu_count)]
+    with open(csv_path, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(headers)
+        for timestamp, cpu_usage, ram_usage, utilization in samples:
+            writer.writerow([datetime.fromtimestamp(timestamp), round(cpu_usage, 1), round(ram_usage, 1)] + list(utilization))
+    return csv_path
+
+def export_samples(days):
+    if days == ['all']:
+        days = [path.stem[len('samples_'):] for path in sorted(CONFIG['LOG_DIR'].glob('samples_*.bin'))]
+    for day in days:
+        csv_path = export_samples_csv(datetime.strptime(day, "%Y-%m-%d").date())
+        print(f"{day}: {csv_path or 'keine Messungen vorhanden'}")
+
+# Die letzten Stunden aller Messungen im Speicher, für Live-Ansichten im Tray und im Dashboard.
+# Feste Anzahl Datensätze im selben Format wie die Messdateien, der Speicherbedarf hängt also nur von
+# LIVE_BUFFER_HOURS, CHECK_INTERVAL und der Anzahl der GPUs ab (8 GPUs, 1 s, 6 h: etwa 0,5 MB).
+class SampleRing:
+    def __init__(self, capacity):
+        self.capacity = max(int(capacity), 1)
+        self.lock = threading.Lock()
+        self.record = None
+        self.data = None
+        self.gpu_count = 0
+        self.head = 0
+        self.count = 0
+        self.last_timestamp = None
+
+    def append(self, timestamp, cpu_usage, ram_usage, gpu_usage):
+        utilization = [SAMPLE_NO_VALUE if reading.utilization is None else reading.utilization for reading in gpu_usage]
+        with self.lock:
+            # Wie in der Messdatei nur steigende Zeitstempel, sonst stimmt die Binärsuche nicht mehr
+            if self.last_timestamp is not None and timestamp <= self.last_timestamp:
+                return
+            self.last_timestamp = timestamp
+            if len(utilization) > self.gpu_count:
+                # Mehr GPUs als bisher: Puffer mit breiteren Datensätzen neu anlegen
+                self.gpu_count = len(utilization)
+                self.record = get_sample_struct(self.gpu_count)
+                self.data = bytearray(self.capacity * self.record.size)
+                self.head = 0
+                self.count = 0
+            utilization += [SAMPLE_NO_VALUE] * (self.gpu_count - len(utilization))
+            self.record.pack_into(self.data, self.head * self.record.size, timestamp, cpu_usage, ram_usage, *utilization)
+            self.head = (self.head + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+
+    def find_index(self, timestamp):
+        # Binärsuche nach dem ersten Datensatz (0 = ältester) mit Zeitstempel >= timestamp
+        oldest = (self.head - self.count) % self.capacity
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if struct.unpack_from('<d', self.data, (oldest + middle) % self.capacity * self.record.size)[0] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def query(self, start_timestamp, end_timestamp):
+        # Liefert (Zeitstempel, CPU, RAM, (Auslastung je GPU)) für start <= t < end, älteste zuerst
+        with self.lock:
+            if not self.count:
+                return []
+            first = self.find_index(start_timestamp)
+            count = self.find_index(end_timestamp) - first
+            if count <= 0:
+                return []
+            size = self.record.size
+            start = (self.head - self.count + first) % self.capacity
+            end = start + count
+            if end <= self.capacity:
+                chunk = bytes(self.data[start * size:end * size])
+            else:
+                chunk = bytes(self.data[start * size:] + self.data[:(end - self.capacity) * size])
+            record = self.record
+        return [(values[0], values[1], values[2], tuple(None if value == SAMPLE_NO_VALUE else value for value in values[3:]))
+                for values in record.iter_unpack(chunk)]
+
+def get_live_buffer_capacity():
+    return CONFIG.get('LIVE_BUFFER_HOURS', LIVE_BUFFER_HOURS) * 3600 / get_min_check_interval()
+
+def downsample_lttb(points, threshold):
+    # Largest-Triangle-Three-Buckets: wählt pro Bucket den Punkt, der mit dem zuletzt gewählten Punkt und dem
+    # Mittelwert des nächsten Buckets das größte Dreieck bildet. Liefert die Indizes der gewählten Punkte.
+    count = len(points)
+    if threshold >= count or threshold < 3:
+        return list(range(count))
+    bucket_size = (count - 2) / (threshold - 2)
+    selected = [0]
+    previous = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+        next_end = min(int((bucket + 2) * bucket_size) + 1, count)
+        next_x = sum(x for x, _ in points[end:next_end]) / (next_end - end)
+        next_y = sum(y for _, y in points[end:next_end]) / (next_end - end)
+        previous_x, previous_y = points[previous]
+        best_area = -1
+        for i in range(start, end):
+            x, y = points[i]
+            area = abs((previous_x - next_x) * (y - previous_y) - (previous_x - x) * (next_y - previous_y))
+            if area > best_area:
+                best_area = area
+                previous = i
+        selected.append(previous)
+    selected.append(count - 1)
+    return selected
+
+def downsample_minmax(points, threshold):
+    # Minimum und Maximum pro Bucket, damit kurze Spitzen auch bei wenigen Punkten sichtbar bleiben
+    count = len(points)
+    if threshold >= count or threshold < 2:
+        return list(range(count))
+    buckets = threshold // 2
+    selected = []
+    for bucket in range(buckets):
+        indexes = range(bucket * count // buckets, (bucket + 1) * count // buckets)
+        if not indexes:
+            continue
+        low = min(indexes, key=lambda i: points[i][1])
+        high = max(indexes, key=lambda i: points[i][1])
+        selected.extend(sorted({low, high}))
+    return selected
+
+DOWNSAMPLING_METHODS = {'lttb': downsample_lttb, 'minmax': downsample_minmax}
+
+def query_live_samples(start_time, end_time, points=LIVE_DEFAULT_POINTS, method='lttb'):
+    if method not in DOWNSAMPLING_METHODS:
+        raise ValueError(f"Unbekannte Methode: {method}")
+    if not live_samples:
+        return []
+    samples = live_samples.query(start_time.timestamp(), end_time.timestamp())
+    # Ausgewählt wird nach der mittleren GPU-Auslastung, CPU und RAM werden zu denselben Zeitpunkten übernommen
+    mean_usage = [get_mean_value(utilization) for _, _, _, utilization in samples]
+    series = [(sample[0], value or 0) for sample, value in zip(samples, mean_usage)]
+    return [{
+        'Timestamp': datetime.fromtimestamp(samples[i][0]),
+        'GPU Usage': mean_usage[i],
+        'CPU Usage': round(samples[i][1], 1),
+        'RAM Usage': round(samples[i][2], 1),
+        'GPU Devices': samples[i][3]
+    } for i in DOWNSAMPLING_METHODS[method](series, points)]
+
+def get_recent_peak_usage():
+    if not live_samples:
+        return None
+    now = time.time()
+    values = [get_mean_value(utilization) for _, _, _, utilization in live_samples.query(now - LIVE_PEAK_WINDOW, now + 1)]
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+# Unveränderlicher Stand nach jedem Durchlauf der Hauptschleife. Tray, Bot und HTTP-API lesen nur diesen
+# Stand, statt selbst nvidia-smi oder die Logs abzufragen.
+MonitorSnapshot = namedtuple('MonitorSnapshot', ['timestamp', 'gpu_usage', 'cpu_usage', 'ram_usage', 'peak_usage', 'total',
+                                                 'device_totals', 'user_totals', 'last_reset_date', 'active_sessions'])
+
+def make_snapshot(timestamp, gpu_usage, cpu_usage, ram_usage):
+    with ledger_lock:
+        total = filtered_total
+        totals = MappingProxyType(dict(device_totals))
+        users = MappingProxyType(dict(user_totals))
+    return MonitorSnapshot(timestamp, gpu_usage, cpu_usage, ram_usage, get_recent_peak_usage(), total,
+                           totals, users, last_reset_date, MappingProxyType(dict(gpu_usage_start)))
+
+def publish_snapshot(snapshot):
+    global latest_snapshot
+    with snapshot_condition:
+        latest_snapshot = snapshot
+        snapshot_condition.notify_all()
+
+def get_snapshot():
+    # Vor dem ersten Durchlauf der Hauptschleife gibt es noch keinen Stand, dann nur die Summen
+    with snapshot_condition:
+        snapshot = latest_snapshot
+    return snapshot or make_snapshot(datetime.now(), None, None, None)
+
+def wait_for_snapshot(previous, timeout):
+    # Wartet, bis ein neuerer Stand als previous veröffentlicht wurde (oder bis zum Timeout)
+    with snapshot_condition:
+        snapshot_condition.wait_for(lambda: latest_snapshot is not previous or should_stop, timeout)
+        return latest_snapshot
+
+# Laufzeitmessung der eigenen Arbeitsschritte (ENABLE_INSTRUMENTATION). Die gemessenen Funktionen werden erst beim
+# Einschalten durch Wrapper ersetzt, ausgeschaltet laufen also die unveränderten Funktionen ohne jeden Zusatzaufwand.
+INSTRUMENTED_FUNCTIONS = {
+    'get_gpu_usage': 'gpu_usage',
+    'get_system_info': 'system_info',
+    'log_rows_to_csv': 'csv',
+    'write_json_atomic': 'json_write',
+    'calculate_filtered_total': 'total',
+    'post_telegram_message': 'telegram',
+    'replay_notion_spool': 'notion',
+    'deliver_with_retry': 'notify_delivery',
+    'push_fleet_batch': 'fleet_push'
+}
+instrumentation_enabled = False
+latency_histograms = {}
+event_counts = defaultdict(int)
+
+class LatencyHistogram:
+    # Feste, logarithmisch verteilte Buckets: konstanter Speicher und Aufwand pro Messung
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def quantile(self, fraction):
+        # Obergrenze des Buckets, in dem das Quantil liegt (höchstens das gemessene Maximum)
+        with self.lock:
+            target = fraction * self.count
+            running = 0
+            for index, count in enumerate(self.counts):
+                running += count
+                if running >= target and count:
+                    return min(LATENCY_BUCKETS[index], self.max) if index < len(LATENCY_BUCKETS) else self.max
+            return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total / self.count * 1000, 3) if self.count else 0,
+            'p50_ms': round(self.quantile(0.5) * 1000, 3),
+            'p99_ms': round(self.quantile(0.99) * 1000, 3),
+            'max_ms': round(self.max * 1000, 3)
+        }
+
+def record_latency(name, seconds):
+    histogram = latency_histograms.get(name)
+    if histogram is None:
+        histogram = latency_histograms.setdefault(name, LatencyHistogram())
+    histogram.observe(seconds)
+
+def count_event(name):
+    if instrumentation_enabled:
+        event_counts[name] += 1
+
+def instrument(name, function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            record_latency(name, time.perf_counter() - started)
+    return wrapper
+
+def install_instrumentation():
+    global instrumentation_enabled
+    if instrumentation_enabled:
+        return
+    module_globals = globals()
+    for function_name, name in INSTRUMENTED_FUNCTIONS.items():
+        module_globals[function_name] = instrument(name, module_globals[function_name])
+    SampleStore.append = instrument('sample_store', SampleStore.append)
+    SessionJournal.write = instrument('journal', SessionJournal.write)
+    instrumentation_enabled = True
+
+def record_tick(seconds, interval):
+    record_latency('tick', seconds)
+    if seconds > SLOW_TICK_FRACTION * interval:
+        event_counts['slow_tick'] += 1
+
+def get_instrumentation_stats():
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'latency': {name: histogram.summary() for name, histogram in sorted(latency_histograms.items())},
+        'events': dict(event_counts)
+    }
+
+def format_instrumentation_stats():
+    lines = [f"{name}: p50 {summary['p50_ms']:.1f} / p99 {summary['p99_ms']:.1f} / max {summary['max_ms']:.1f} ms ({summary['count']}x)"
+             for name, summary in ((name, histogram.summary()) for name, histogram in sorted(latency_histograms.items()))]
+    lines.append(f"Langsame Durchläufe: {event_counts['slow_tick']}, verpasste Takte: {event_counts['missed_tick']}, "
+                 f"veraltete Messungen: {event_counts['stale_sample']}, Wiederholungen beim Senden: {event_counts['notify_retry']}")
+    return lines
+
+def report_instrumentation_stats():
+    logging.info("Laufzeiten: " + " | ".join(format_instrumentation_stats()))
+    if CONFIG.get('INSTRUMENTATION_STATS_FILE', False):
+        try:
+            write_json_atomic(CONFIG['LOG_DIR'] / 'monitor_stats.json', get_instrumentation_stats())
+        except Exception as e:
+            log_error(f"Fehler beim Schreiben der Laufzeitstatistik: {str(e)}")
+
+# Vorab aggregierte Werte pro Minute, Stunde und Tag, damit das Dashboard nicht alle Rohdaten laden muss.
+# Busy Seconds ist die Zeit in Nutzungssitzungen (summiert über alle GPUs), Sessions die Anzahl der begonnenen Sitzungen.
+def get_bucket_start(timestamp, resolution):
+    if resolution == 'minute':
+        return timestamp.replace(second=0, microsecond=0)
+    if resolution == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def get_rollup_path(log_dir, resolution, bucket_start):
+    if resolution == 'minute':
+        return log_dir / f"rollup_minute_{bucket_start.strftime('%Y-%m-%d')}.csv"
+    if resolution == 'hour':
+        return log_dir / f"rollup_hour_{bucket_start.strftime('%Y-%m')}.csv"
+    return log_dir / "rollup_day.csv"
+
+def new_rollup_bucket():
+    return {'min': None, 'max': None, 'sum': 0.0, 'cpu': 0.0, 'ram': 0.0, 'samples': 0, 'busy': 0.0, 'sessions': 0}
+
+def add_to_rollup_bucket(bucket, utilization, cpu_usage, ram_usage, samples=1):
+    if utilization is None:
+        return
+    bucket['min'] = utilization if bucket['min'] is None else min(bucket['min'], utilization)
+    bucket['max'] = utilization if bucket['max'] is None else max(bucket['max'], utilization)
+    bucket['sum'] += utilization * samples
+    bucket['cpu'] += cpu_usage * samples
+    bucket['ram'] += ram_usage * samples
+    bucket['samples'] += samples
+
+def format_rollup_row(bucket_start, bucket):
+    samples = bucket['samples']
+    mean = lambda key: round(bucket[key] / samples, 2) if samples else None
+    return [bucket_start, bucket['min'], bucket['max'], mean('sum'), mean('cpu'), mean('ram'),
+            round(bucket['busy'], 2), bucket['sessions'], samples]
+
+def parse_rollup_row(row):
+    bucket = new_rollup_bucket()
+    samples = int(row['Samples'])
+    if samples:
+        bucket['min'] = float(row['Min Usage'])
+        bucket['max'] = float(row['Max Usage'])
+        bucket['sum'] = float(row['Mean Usage']) * samples
+        bucket['cpu'] = float(row['CPU Usage']) * samples
+        bucket['ram'] = float(row['RAM Usage']) * samples
+    bucket['samples'] = samples
+    bucket['busy'] = float(row['Busy Seconds'])
+    bucket['sessions'] = int(row['Sessions'])
+    return bucket
+
+def read_last_rollup_row(path):
+    # Nur das Ende der Datei lesen: die Stunden- und Tagesdateien werden jede Minute aktualisiert
+    try:
+        with open(path, 'rb') as file:
+            size = file.seek(0, os.SEEK_END)
+            file.seek(max(size - 4096, 0))
+            lines = file.read().splitlines(keepends=True)
+    except FileNotFoundError:
+        return None, None
+    if not lines:
+        return None, None
+    offset = size - len(lines[-1])
+    row = dict(zip(ROLLUP_HEADERS, next(csv.reader([lines[-1].decode()]))))
+    if offset == 0 or row.get('Timestamp') == 'Timestamp':
+        return None, None
+    return offset, row
+
+class Rollups:
+    def __init__(self, log_dir):
+        self.log_dir = log_dir
+        self.buckets = {resolution: (None, None) for resolution in ROLLUP_RESOLUTIONS}
+        self.lock = threading.Lock()
+
+    def get_bucket(self, resolution, timestamp):
+        bucket_start = get_bucket_start(timestamp, resolution)
+        current_start, bucket = self.buckets[resolution]
+        if current_start != bucket_start:
+            if bucket is not None:
+                self.write_bucket(resolution, current_start, bucket)
+                if resolution == 'minute':
+                    self.write_open_buckets()
+                bucket = new_rollup_bucket()
+            else:
+                bucket = self.resume_bucket(resolution, bucket_start)
+            self.buckets[resolution] = (bucket_start, bucket)
+        return bucket
+
+    def write_bucket(self, resolution, bucket_start, bucket):
+        # Ein Intervall hat genau eine Zeile: steht es schon als letzte Zeile in der Datei, wird sie ersetzt
+        path = get_rollup_path(self.log_dir, resolution, bucket_start)
+        offset, row = read_last_rollup_row(path)
+        if row is not None and datetime.fromisoformat(row['Timestamp']) == bucket_start:
+            with open(path, 'r+', newline='') as file:
+                file.truncate(offset)
+        log_to_csv(path, format_rollup_row(bucket_start, bucket), ROLLUP_HEADERS)
+
+    def write_open_buckets(self):
+        # Stunde und Tag laufen lange; ihr Zwischenstand wird bei jedem Minutenwechsel geschrieben,
+        # damit nach einem Absturz (kill -9) höchstens die letzte Minute fehlt
+        for resolution in ('hour', 'day'):
+            bucket_start, bucket = self.buckets[resolution]
+            if bucket is not None:
+                self.write_bucket(resolution, bucket_start, bucket)
+
+    def resume_bucket(self, resolution, bucket_start):
+        # Nach einem Neustart wird ein bereits geschriebener Eintrag für das laufende Intervall
+        # wieder aufgenommen; die Zeile bleibt stehen und wird beim nächsten Schreiben ersetzt
+        offset, row = read_last_rollup_row(get_rollup_path(self.log_dir, resolution, bucket_start))
+        if row is None or datetime.fromisoformat(row['Timestamp']) != bucket_start:
+            return new_rollup_bucket()
+        return parse_rollup_row(row)
+
+    def add_sample(self, timestamp, utilization, cpu_usage, ram_usage, busy_seconds):
+        with self.lock:
+            for resolution in ROLLUP_RESOLUTIONS:
+                bucket = self.get_bucket(resolution, timestamp)
+                add_to_rollup_bucket(bucket, utilization, cpu_usage, ram_usage)
+                bucket['busy'] += busy_seconds
+
+    def add_session(self, timestamp):
+        with self.lock:
+            for resolution in ROLLUP_RESOLUTIONS:
+                self.get_bucket(resolution, timestamp)['sessions'] += 1
+
+    def get_open_buckets(self):
+        with self.lock:
+            return {resolution: (bucket_start, dict(bucket)) for resolution, (bucket_start, bucket) in self.buckets.items() if bucket is not None}
+
+    def close(self):
+        with self.lock:
+            for resolution, (bucket_start, bucket) in self.buckets.items():
+                if bucket is not None:
+                    self.write_bucket(resolution, bucket_start, bucket)
+            self.buckets = {resolution: (None, None) for resolution in ROLLUP_RESOLUTIONS}
+
+def iter_rollup_samples(day):
+    # Für den Neuaufbau: die Messungen eines Tages aus der Binärdatei, sonst aus dem regulären Log
+    start_time = datetime.combine(day, datetime.min.time())
+    samples = read_samples(start_time, start_time + timedelta(days=1))
+    if samples:
+        for timestamp, cpu_usage, ram_usage, utilization in samples:
+            values = [value for value in utilization if value is not None]
+            yield datetime.fromtimestamp(timestamp), (sum(values) / len(values) if values else None), cpu_usage, ram_usage
+        return
+    for row in iter_log_rows('regular_log', start_time, start_time + timedelta(days=1)):
+        if not row.get('GPU Usage'):
+            continue
+        yield datetime.fromisoformat(row['Timestamp']), float(row['GPU Usage']), float(row['CPU Usage']), float(row['RAM Usage'])
+
+def rebuild_rollups():
+    log_dir = CONFIG['LOG_DIR']
+    for rollup_file in log_dir.glob('rollup_*.csv'):
+        rollup_file.unlink()
+
+    buckets = {resolution: defaultdict(new_rollup_bucket) for resolution in ROLLUP_RESOLUTIONS}
+    days = set()
+    for log_file in log_dir.glob('samples_*.bin'):
+        days.add(datetime.strptime(log_file.stem.rsplit('_', 1)[1], "%Y-%m-%d").date())
+    for log_file in get_log_files('regular_log'):
+        _, file_start, file_end = parse_log_name(log_file)
+        days.update(iter_days(file_start, file_end - timedelta(microseconds=1)))
+    for day in sorted(days):
+        for timestamp, utilization, cpu_usage, ram_usage in iter_rollup_samples(day):
+            for resolution in ROLLUP_RESOLUTIONS:
+                add_to_rollup_bucket(buckets[resolution][get_bucket_start(timestamp, resolution)], utilization, cpu_usage, ram_usage)
+
+    # Sitzungszeit wird exakt auf die Intervalle aufgeteilt, die eine Sitzung überdeckt
+    session_count = 0
+    for device, start_time, end_time, duration in iter_usage_log_rows():
+        session_count += 1
+        for resolution in ROLLUP_RESOLUTIONS:
+            bucket_start = get_bucket_start(start_time, resolution)
+            buckets[resolution][bucket_start]['sessions'] += 1
+            while bucket_start < end_time:
+                bucket_end = bucket_start + ROLLUP_STEPS[resolution]
+                overlap = (min(end_time, bucket_end) - max(start_time, bucket_start)).total_seconds()
+                buckets[resolution][bucket_start]['busy'] += max(overlap, 0)
+                bucket_start = bucket_end
+
+    rows = defaultdict(list)
+    for resolution in ROLLUP_RESOLUTIONS:
+        for bucket_start in sorted(buckets[resolution]):
+            rows[get_rollup_path(log_dir, resolution, bucket_start)].append(format_rollup_row(bucket_start, buckets[resolution][bucket_start]))
+    for path, path_rows in rows.items():
+        log_rows_to_csv(path, path_rows, ROLLUP_HEADERS)
+    print(f"{len(days)} Tage und {session_count} Sitzungen verarbeitet, {len(rows)} Rollup-Dateien geschrieben.")
+
+# Lebenszyklus der CSV-Logs: abgeschlossene Tage werden mit gzip komprimiert und nach Monatsende zu einem Monatsarchiv
+# (z.B. regular_log_2024-08.csv.gz) zusammengefasst, alte Dateien nach Ablauf der Aufbewahrungsfrist gelöscht.
+# log_index.json hält pro komprimierter Datei Zeitbereich, Zeilenzahl und Summen. Damit überspringen Abfragen und die
+# Gesamtsumme seit dem Reset ganze Dateien, ohne sie zu öffnen.
+LOG_TIME_COLUMNS = {'regular_log': 'Timestamp', 'gpu_usage_log': 'Start Time', 'gpu_attribution_log': 'Start Time'}
+LOG_HEADERS = {'regular_log': REGULAR_LOG_HEADERS, 'gpu_usage_log': USAGE_LOG_HEADERS, 'gpu_attribution_log': ATTRIBUTION_LOG_HEADERS}
+# Spalte, nach der summiert wird, Wert für leere Zellen (ältere Logs ohne GPU-Spalte stammen von Einzel-GPU-Systemen) und Summand
+LOG_TOTAL_COLUMNS = {'gpu_usage_log': ('GPU', '0', 'Duration (seconds)'), 'gpu_attribution_log': ('User', '', 'GPU Seconds')}
+log_index = None
+# Lesende halten die Sperre, solange sie Dateien auflisten und lesen; die Verdichtung nur für das Austauschen der Dateien
+log_files_lock = threading.RLock()
+
+def get_log_index_path():
+    return CONFIG['LOG_DIR'] / 'log_index.json'
+
+def load_log_index():
+    global log_index
+    if log_index is None:
+        try:
+            with open(get_log_index_path(), 'r') as index_file:
+                log_index = json.load(index_file)
+        except FileNotFoundError:
+            log_index = {}
+        except ValueError as e:
+            logging.warning(f"Log-Index konnte nicht gelesen werden, wird neu aufgebaut: {str(e)}")
+            log_index = {}
+    return log_index
+
+def get_index_entry(path):
+    # Ein Eintrag gilt nur, solange die Datei nicht verändert wurde. Der Index gehört nur zum eigenen Log-Verzeichnis.
+    if path.parent != CONFIG['LOG_DIR']:
+        return None
+    entry = load_log_index().get(path.name)
+    try:
+        if entry and entry['size'] == path.stat().st_size:
+            return entry
+    except FileNotFoundError:
+        pass
+    return None
+
+def parse_log_name(path):
+    # (Präfix, Beginn, Ende) für regular_log_2024-08-14.csv, regular_log_2024-08-14.csv.gz und regular_log_2024-08.csv.gz
+    for suffix in ('.csv.gz', '.csv'):
+        if path.name.endswith(suffix):
+            prefix, _, date_str = path.name[:-len(suffix)].rpartition('_')
+            break
+    else:
+        return None
+    try:
+        if len(date_str) == 7:
+            file_start = datetime.strptime(date_str, "%Y-%m")
+            return prefix, file_start, (file_start + timedelta(days=32)).replace(day=1)
+        file_start = datetime.strptime(date_str, "%Y-%m-%d")
+        return prefix, file_start, file_start + timedelta(days=1)
+    except ValueError:
+        return None
+
+def get_log_files(prefix, start_time=None, end_time=None, log_dir=None):
+    # Alle Dateien eines Log-Typs, die Zeilen im Zeitbereich enthalten können, nach Zeit sortiert.
+    # Der Bereich ergibt sich aus dem Dateinamen oder, genauer, aus dem Index.
+    files = []
+    for path in (log_dir or CONFIG['LOG_DIR']).glob(f'{prefix}_*.csv*'):
+        parsed = parse_log_name(path)
+        if parsed is None or parsed[0] != prefix:
+            continue
+        _, file_start, file_end = parsed
+        entry = get_index_entry(path) if path.suffix == '.gz' else None
+        if entry is not None:
+            if not entry['rows']:
+                continue
+            file_start = datetime.fromisoformat(entry['start'])
+            file_end = datetime.fromisoformat(entry['end']) + timedelta(microseconds=1)
+        if (start_time and file_end <= start_time) or (end_time and file_start >= end_time):
+            continue
+        files.append((file_start, path.name, path))
+    return [path for _, _, path in sorted(files)]
+
+def open_log_file(path):
+    if path.suffix == '.gz':
+        return gzip.open(path, 'rt', newline='')
+    return open(path, 'r', newline='')
+
+def iter_log_rows(prefix, start_time=None, end_time=None, log_dir=None):
+    # Streamt die Zeilen aller passenden Dateien, komprimiert oder nicht
+    time_column = LOG_TIME_COLUMNS[prefix]
+    with log_files_lock:
+        for path in get_log_files(prefix, start_time, end_time, log_dir):
+            with open_log_file(path) as file:
+                for row in csv.DictReader(file):
+                    if (start_time is None and end_time is None) or in_range(row, start_time or datetime.min, end_time or datetime.max, time_column):
+                        yield row
+
+def sum_log_file(path, prefix, since):
+    # Summen pro GPU bzw. Benutzer aller Zeilen ab since. Komprimierte Dateien, die ganz nach since liegen, kommen aus dem Index.
+    entry = get_index_entry(path) if path.suffix == '.gz' else None
+    if entry is not None and entry['rows'] and datetime.fromisoformat(entry['start']) >= since:
+        return entry['totals']
+    key_column, default_key, value_column = LOG_TOTAL_COLUMNS[prefix]
+    totals = defaultdict(float)
+    with open_log_file(path) as file:
+        for row in csv.DictReader(file):
+            if datetime.fromisoformat(row[LOG_TIME_COLUMNS[prefix]]) >= since:
+                totals[row.get(key_column) or default_key] += float(row[value_column])
+    return totals
+
+def scan_log_totals(prefix, since, log_dir=None):
+    totals = defaultdict(float)
+    with log_files_lock:
+        for path in get_log_files(prefix, since, log_dir=log_dir):
+            for key, value in sum_log_file(path, prefix, since).items():
+                totals[key] += value
+    return totals
+
+def make_index_entry(path, prefix):
+    rows = 0
+    first = last = None
+    totals = defaultdict(float)
+    total_columns = LOG_TOTAL_COLUMNS.get(prefix)
+    with open_log_file(path) as file:
+        for row in csv.DictReader(file):
+            try:
+                timestamp = datetime.fromisoformat(row[LOG_TIME_COLUMNS[prefix]])
+            except (KeyError, TypeError, ValueError):
+                continue
+            rows += 1
+            first = timestamp if first is None else min(first, timestamp)
+            last = timestamp if last is None else max(last, timestamp)
+            if total_columns:
+                key_column, default_key, value_column = total_columns
+                totals[row.get(key_column) or default_key] += float(row[value_column])
+    return {
+        'size': path.stat().st_size,
+        'rows': rows,
+        'start': first.isoformat() if first else None,
+        'end': last.isoformat() if last else None,
+        'totals': dict(totals)
+    }
+
+def save_log_index():
+    write_json_atomic(get_log_index_path(), log_index)
+
+def write_log_archive(target, sources, prefix):
+    # Schreibt die Zeilen der Quellen komprimiert in eine temporäre Datei neben target. Ein vorhandenes target wird
+    # übernommen und gibt die Spalten vor, sonst die Standardspalten plus zusätzliche Spalten älterer Logs.
+    fieldnames = list(LOG_HEADERS[prefix])
+    if target.exists():
+        with open_log_file(target) as file:
+            fieldnames = next(csv.reader(file), fieldnames)
+        sources = [target] + sources
+    else:
+        for source in sources:
+            with open_log_file(source) as file:
+                fieldnames.extend(column for column in next(csv.reader(file), []) if column not in fieldnames)
+    tmp_path = target.with_name(target.name + '.tmp.gz')
+    with open(tmp_path, 'wb') as raw_file:
+        with gzip.open(raw_file, 'wt', newline='') as archive:
+            writer = csv.DictWriter(archive, fieldnames, restval='', extrasaction='ignore')
+            writer.writeheader()
+            for source in sources:
+                with open_log_file(source) as file:
+                    writer.writerows(csv.DictReader(file))
+        raw_file.flush()
+        os.fsync(raw_file.fileno())
+    return tmp_path
+
+def archive_log_files(target, sources, prefix):
+    tmp_path = write_log_archive(target, sources, prefix)
+    entry = make_index_entry(tmp_path, prefix)
+    with log_files_lock:
+        os.replace(tmp_path, target)
+        for source in sources:
+            source.unlink()
+            log_index.pop(source.name, None)
+        log_index[target.name] = entry
+        save_log_index()
+
+def delete_log_files(paths):
+    with log_files_lock:
+        for path in paths:
+            path.unlink()
+            log_index.pop(path.name, None)
+        save_log_index()
+
+def compact_logs(now=None):
+    now = now or datetime.now()
+    load_log_index()
+    log_dir = CONFIG['LOG_DIR']
+    # Tage vor compress_before sind abgeschlossen. Ein Tag, an dem eine noch laufende Sitzung begann, bekommt
+    # deren Eintrag erst am Ende der Sitzung und bleibt deshalb unverändert.
+    compress_after_days = max(CONFIG.get('LOG_COMPRESS_AFTER_DAYS', 2), 1)
+    compress_before = datetime.combine(now.date(), datetime.min.time()) - timedelta(days=compress_after_days - 1)
+    running = list(gpu_usage_start.values())
+    if running:
+        compress_before = min(compress_before, datetime.combine(min(running).date(), datetime.min.time()))
+
+    compressed, archived = 0, 0
+    for prefix in LOG_TIME_COLUMNS:
+        # Fehlende Indexeinträge nachtragen, z.B. nach dem Löschen von log_index.json
+        for path in get_log_files(prefix):
+            if path.suffix == '.gz' and get_index_entry(path) is None:
+                log_index[path.name] = make_index_entry(path, prefix)
+                save_log_index()
+
+        months = defaultdict(list)
+        for path in get_log_files(prefix):
+            _, file_start, file_end = parse_log_name(path)
+            if file_end > compress_before or file_end - file_start > timedelta(days=1):
+                continue
+            months[file_start.strftime('%Y-%m')].append(path)
+        for month, paths in sorted(months.items()):
+            month_end = (datetime.strptime(month, "%Y-%m") + timedelta(days=32)).replace(day=1)
+            if month_end <= compress_before:
+                # Ganzer Monat abgeschlossen: alle Tagesdateien in das Monatsarchiv
+                archive_log_files(log_dir / f"{prefix}_{month}.csv.gz", paths, prefix)
+                archived += len(paths)
+                continue
+            for path in paths:
+                if path.suffix != '.gz':
+                    archive_log_files(path.with_name(path.name + '.gz'), [path], prefix)
+                    compressed += 1
+
+    expired = []
+    retention_days = CONFIG.get('LOG_RETENTION_DAYS')
+    if retention_days:
+        cutoff = now - timedelta(days=retention_days)
+        expired += [path for path in get_log_files('regular_log') if parse_log_name(path)[2] <= cutoff]
+        expired += [path for path in log_dir.glob('samples_*.bin')
+                    if datetime.strptime(path.stem[len('samples_'):], "%Y-%m-%d") + timedelta(days=1) <= cutoff]
+    usage_retention_days = CONFIG.get('USAGE_LOG_RETENTION_DAYS')
+    if usage_retention_days:
+        # Sitzungen seit dem letzten Reset bleiben immer erhalten, damit sich die Gesamtsumme nicht ändert
+        cutoff = min(now - timedelta(days=usage_retention_days), last_reset_date)
+        for prefix in LOG_TOTAL_COLUMNS:
+            expired += [path for path in get_log_files(prefix) if parse_log_name(path)[2] <= cutoff]
+    if expired:
+        delete_log_files(expired)
+
+    if compressed or archived or expired:
+        refresh_ledger_files()
+        logging.info(f"Logs verdichtet: {compressed} Dateien komprimiert, {archived} in Monatsarchive übernommen, {len(expired)} gelöscht")
+    return compressed, archived, len(expired)
+
+def log_compaction_loop():
+    next_run = time.monotonic()
+    while not should_stop:
+        if time.monotonic() >= next_run:
+            try:
+                compact_logs()
+            except Exception as e:
+                log_error(f"Fehler beim Verdichten der Logs: {str(e)}")
+            next_run = time.monotonic() + LOG_COMPACTION_INTERVAL
+        time.sleep(1)
+
+def iter_usage_log_rows():
+    for row in iter_log_rows('gpu_usage_log'):
+        # Ältere Logs ohne GPU-Spalte stammen von Einzel-GPU-Systemen
+        device = int(row.get('GPU') or 0)
+        yield (device,
+               datetime.fromisoformat(row['Start Time']),
+               datetime.fromisoformat(row['End Time']),
+               float(row['Duration (seconds)']))
+
+def scan_usage_logs():
+    return {int(device): total for device, total in scan_log_totals('gpu_usage_log', last_reset_date).items()}
+
+def scan_attribution_logs():
+    return dict(scan_log_totals('gpu_attribution_log', last_reset_date))
+
+# Laufende Gesamtsumme (Ledger), damit nicht bei jeder Abfrage alle CSV-Dateien gelesen werden
+def get_ledger_path():
+    return CONFIG['LOG_DIR'] / 'usage_ledger.json'
+
+def get_usage_log_sizes():
+    log_files = get_log_files('gpu_usage_log') + get_log_files('gpu_attribution_log')
+    return {log_file.name: log_file.stat().st_size for log_file in log_files}
+
+def save_ledger():
+    ledger = {
+        'last_reset_date': last_reset_date.isoformat(),
+        'total': filtered_total,
+        'device_totals': device_totals,
+        'user_totals': user_totals,
+        'files': usage_log_sizes
+    }
+    write_json_atomic(get_ledger_path(), ledger)
+
+def rebuild_ledger():
+    global filtered_total, device_totals, user_totals, usage_log_sizes
+    with ledger_lock:
+        usage_log_sizes = get_usage_log_sizes()
+        device_totals = scan_usage_logs()
+        user_totals = scan_attribution_logs()
+        filtered_total = sum(device_totals.values())
+        save_ledger()
+    logging.info(f"Ledger aus {len(usage_log_sizes)} Log-Dateien neu aufgebaut")
+    return filtered_total
+
+def load_ledger():
+    global filtered_total, device_totals, user_totals, usage_log_sizes
+    # Der Ledger ist nur gültig, wenn Reset-Datum und Größe aller Log-Dateien übereinstimmen
+    try:
+        with open(get_ledger_path(), 'r') as ledger_file:
+            ledger = json.load(ledger_file)
+        sizes = get_usage_log_sizes()
+        if ledger['last_reset_date'] == last_reset_date.isoformat() and ledger['files'] == sizes:
+            with ledger_lock:
+                filtered_total = float(ledger['total'])
+                device_totals = {int(device): float(total) for device, total in ledger['device_totals'].items()}
+                user_totals = {user: float(total) for user, total in ledger['user_totals'].items()}
+                usage_log_sizes = sizes
+            return filtered_total
+        logging.info("Ledger ist veraltet und wird neu aufgebaut")
+    except FileNotFoundError:
+        pass
+    except (ValueError, KeyError, TypeError) as e:
+        logging.warning(f"Ledger konnte nicht gelesen werden, wird neu aufgebaut: {str(e)}")
+    return rebuild_ledger()
+
+def refresh_ledger_files():
+    # Nach dem Verdichten: gleiche Summen, aber andere Dateien
+    global usage_log_sizes
+    with ledger_lock, log_files_lock:
+        usage_log_sizes = get_usage_log_sizes()
+        save_ledger()
+
+def add_to_ledger(log_file, device, start_time, duration):
+    global filtered_total
+    with ledger_lock:
+        if start_time >= last_reset_date:
+            filtered_total += duration
+            device_totals[device] = device_totals.get(device, 0) + duration
+        if log_file.exists():
+            usage_log_sizes[log_file.name] = log_file.stat().st_size
+        save_ledger()
+    return filtered_total
+
+def add_attribution_to_ledger(log_file, start_time, seconds_by_user):
+    with ledger_lock:
+        if start_time >= last_reset_date:
+            for user, seconds in seconds_by_user.items():
+                user_totals[user] = user_totals.get(user, 0) + seconds
+        if log_file.exists():
+            usage_log_sizes[log_file.name] = log_file.stat().st_size
+        save_ledger()
 
 def calculate_filtered_total():
-    total = 0
-    for log_file in CONFIG['LOG_DIR'].glob('gpu_usage_log_*.csv'):
-        with open(log_file, 'r') as file:
-            csv_reader = csv.DictReader(file)
-            for row in csv_reader:
-                start_time = datetime.fromisoformat(row['Start Time'])
-                if start_time >= last_reset_date:
-                    total += float(row['Duration (seconds)'])
-    return total
+    return filtered_total
+
+def get_device_total(device):
+    return device_totals.get(device, 0)
 
-def log_gpu_usage(start_time, end_time, duration):
+def log_gpu_usage(device, start_time, end_time, duration):
     global filtered_total
     date_str = start_time.strftime("%Y-%m-%d")
     log_file = CONFIG['LOG_DIR'] / f"gpu_usage_log_{date_str}.csv"
-    headers = ["Start Time", "End Time", "Duration (seconds)"]
+    device_total = get_device_total(device) + (duration if start_time >= last_reset_date else 0)
+    data = [start_time, end_time, duration, device, device_total]
+    log_to_csv(log_file, data, USAGE_LOG_HEADERS)
     
-    data = [start_time, end_time, duration]
-    log_to_csv(log_file, data, headers)
-    
-    filtered_total = calculate_filtered_total()  # Recalculate total after logging
+    filtered_total = add_to_ledger(log_file, device, start_time, duration)
     
     message = (
-        f"🧊 GPU-Nutzung unter Schwellenwert\n"
+        f"🧊 GPU {device}: Nutzung unter Schwellenwert\n"
         f"Dauer: {duration:.2f}s\n"
+        f"Gesamtsumme GPU {device}: {get_device_total(device):.2f}s\n"
         f"Gesamtsumme seit Reset: {filtered_total:.2f}s"
     )
     send_telegram_message(message)
     
-    save_config()
-    
     return filtered_total
 
-def update_notion(start_time, end_time, duration):
-    if not CONFIG.get('ENABLE_NOTION', False):
+# Zustandsautomat einer GPU ohne Seiteneffekte, gemeinsam für die Hauptschleife und die Offline-Auswertung.
+# Liefert (Sitzungsbeginn, Beginn der Abkühlphase, Ereignis) mit Ereignis None, 'open', 'resume', 'cool_down' oder 'close'.
+# Bei 'close' geht die Sitzung vom bisherigen Beginn bis zum Beginn der Abkühlphase.
+def step_session(session_start, cool_down, timestamp, utilization, threshold, cool_down_period):
+    if utilization is None:
+        return session_start, cool_down, None
+    if utilization > threshold:
+        if session_start is None:
+            return timestamp, None, 'open'
+        return session_start, None, 'resume' if cool_down is not None else None
+    if session_start is None:
+        return None, None, None
+    if cool_down is None:
+        return session_start, timestamp, 'cool_down'
+    if timestamp - cool_down >= cool_down_period:
+        return None, None, 'close'
+    return session_start, cool_down, None
+
+# Offline-Auswertung: spielt die gespeicherten Messungen für viele Schwellenwerte und Abkühlphasen auf einmal durch.
+# Zeitstempel als ganze Mikrosekunden, damit die Vergleiche genau wie mit datetime in der Hauptschleife ausfallen.
+def load_sample_arrays(start_time=None, end_time=None):
+    import numpy as np
+    timestamps, utilization = [], []
+    for path in sorted(CONFIG['LOG_DIR'].glob('samples_*.bin')):
+        day = datetime.strptime(path.stem[len('samples_'):], "%Y-%m-%d").date()
+        if (start_time and day < start_time.date()) or (end_time and day > end_time.date()):
+            continue
+        with open(path, 'rb') as sample_file:
+            magic, version, gpu_count = SAMPLE_HEADER.unpack(sample_file.read(SAMPLE_HEADER.size))
+        if magic != SAMPLE_FILE_MAGIC or version != SAMPLE_FILE_VERSION:
+            raise ValueError(f"Unbekanntes Format der Messdatei {path}")
+        dtype = np.dtype([('timestamp', '<f8'), ('cpu', '<f4'), ('ram', '<f4'), ('gpu', 'u1', (gpu_count,))])
+        count = (path.stat().st_size - SAMPLE_HEADER.size) // dtype.itemsize
+        records = np.fromfile(path, dtype=dtype, count=count, offset=SAMPLE_HEADER.size)
+        timestamps.append(np.round(records['timestamp'] * 1e6).astype(np.int64))
+        utilization.append(records['gpu'])
+    if not timestamps:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 0), dtype=np.uint8)
+    gpu_count = max(values.shape[1] for values in utilization)
+    utilization = [np.pad(values, ((0, 0), (0, gpu_count - values.shape[1])), constant_values=SAMPLE_NO_VALUE) for values in utilization]
+    timestamps, utilization = np.concatenate(timestamps), np.concatenate(utilization)
+    in_range = np.ones(len(timestamps), dtype=bool)
+    if start_time:
+        in_range &= timestamps >= int(start_time.timestamp() * 1e6)
+    if end_time:
+        in_range &= timestamps < int(end_time.timestamp() * 1e6)
+    return timestamps[in_range], utilization[in_range]
+
+def find_cool_down_gaps(busy):
+    # Folgen nicht ausgelasteter Messungen nach einer ausgelasteten: (erste ausgelastete Messung,
+    # erster und letzter Index jeder Lücke, Index der nächsten ausgelasteten Messung bzw. len(busy) am Ende)
+    import numpy as np
+    busy_indexes = np.flatnonzero(busy)
+    if not busy_indexes.size:
+        return None
+    next_busy = np.append(busy_indexes[1:], len(busy))
+    has_gap = next_busy > busy_indexes + 1
+    return busy_indexes[0], busy_indexes[has_gap] + 1, next_busy[has_gap] - 1, next_busy[has_gap]
+
+def get_closing_gaps(timestamps, first, last, cool_down_periods_us):
+    # Eine Sitzung endet in einer Lücke, sobald eine spätere Messung der Lücke die Abkühlphase erreicht
+    span = timestamps[last] - timestamps[first]
+    return (last > first)[:, None] & (span[:, None] >= cool_down_periods_us[None, :])
+
+def replay_device_sessions(timestamps, utilization, threshold, cool_down_period):
+    # Sitzungen (Beginn, Ende in µs) einer GPU für einen Schwellenwert und eine Abkühlphase in Sekunden
+    import numpy as np
+    valid = utilization != SAMPLE_NO_VALUE
+    timestamps = timestamps[valid]
+    gaps = find_cool_down_gaps(utilization[valid] > threshold)
+    if gaps is None:
+        return []
+    first_busy, first, last, next_busy = gaps
+    closing = get_closing_gaps(timestamps, first, last, np.array([int(round(cool_down_period * 1e6))]))[:, 0]
+    starts = np.concatenate(([first_busy], next_busy[closing][:-1]))
+    ends = first[closing]
+    return list(zip(timestamps[starts[:len(ends)]].tolist(), timestamps[ends].tolist()))
+
+def replay_grid(timestamps, utilization, thresholds, cool_down_periods):
+    # Summe der Sitzungsdauer (Sekunden) und Anzahl abgeschlossener Sitzungen über alle GPUs,
+    # als Matrix Schwellenwert × Abkühlphase. Pro Schwellenwert ein Durchlauf über alle Messungen,
+    # alle Abkühlphasen werden dabei gemeinsam ausgewertet.
+    import numpy as np
+    cool_down_periods_us = np.array([int(round(period * 1e6)) for period in cool_down_periods], dtype=np.int64)
+    totals = np.zeros((len(thresholds), len(cool_down_periods)))
+    counts = np.zeros((len(thresholds), len(cool_down_periods)), dtype=np.int64)
+    for device in range(utilization.shape[1]):
+        valid = utilization[:, device] != SAMPLE_NO_VALUE
+        # Relativ zur ersten Messung, damit die Summen in int64 nicht überlaufen
+        device_timestamps = timestamps[valid] - (timestamps[valid][0] if valid.any() else 0)
+        device_utilization = utilization[valid, device]
+        for row, threshold in enumerate(thresholds):
+            gaps = find_cool_down_gaps(device_utilization > threshold)
+            if gaps is None:
+                continue
+            first_busy, first, last, next_busy = gaps
+            if not first.size:
+                # Ohne Lücke (immer ausgelastet oder ausgelastet bis zum Ende) ist keine Sitzung abgeschlossen
+                continue
+            closing = get_closing_gaps(device_timestamps, first, last, cool_down_periods_us)
+            closed = closing.sum(axis=0)
+            # Jede abgeschlossene Sitzung beginnt mit der ersten ausgelasteten Messung bzw. der nächsten nach
+            # einer beendenden Lücke. Die nach der letzten beendenden Lücke ist am Ende noch offen.
+            next_start = device_timestamps[np.minimum(next_busy, len(device_timestamps) - 1)]
+            last_closing = len(first) - 1 - np.argmax(closing[::-1], axis=0)
+            start_sum = (closing * next_start[:, None]).sum(axis=0) - np.where(closed > 0, next_start[last_closing], 0)
+            start_sum += np.where(closed > 0, device_timestamps[first_busy], 0)
+            end_sum = (closing * device_timestamps[first][:, None]).sum(axis=0)
+            totals[row] += (end_sum - start_sum) / 1e6
+            counts[row] += closed
+    return totals, counts
+
+def replay_device_sessions_stepwise(timestamps, utilization, threshold, cool_down_period):
+    # Referenz: derselbe Zustandsautomat wie in der Hauptschleife, Messung für Messung
+    sessions = []
+    session_start, cool_down = None, None
+    cool_down_period_us = int(round(cool_down_period * 1e6))
+    for timestamp, value in zip(timestamps.tolist(), utilization.tolist()):
+        previous_start, previous_cool_down = session_start, cool_down
+        session_start, cool_down, event = step_session(session_start, cool_down, timestamp,
+                                                       None if value == SAMPLE_NO_VALUE else value,
+                                                       threshold, cool_down_period_us)
+        if event == 'close':
+            sessions.append((previous_start, previous_cool_down))
+    return sessions
+
+def run_replay(thresholds, cool_down_periods, start_time=None, end_time=None, verify=False):
+    try:
+        import numpy as np
+    except ImportError:
+        print("Für die Offline-Auswertung wird numpy benötigt: pip install numpy")
+        return False
+    timestamps, utilization = load_sample_arrays(start_time, end_time)
+    if not len(timestamps):
+        print("Keine Messungen im gewählten Zeitraum vorhanden.")
+        return False
+    started = time.perf_counter()
+    totals, counts = replay_grid(timestamps, utilization, thresholds, cool_down_periods)
+    elapsed = time.perf_counter() - started
+    print(f"{len(timestamps)} Messungen, {utilization.shape[1]} GPU(s), "
+          f"{datetime.fromtimestamp(timestamps[0] / 1e6):%Y-%m-%d %H:%M} bis {datetime.fromtimestamp(timestamps[-1] / 1e6):%Y-%m-%d %H:%M}")
+    print("Summe abgeschlossener Sitzungen (Stunden / Anzahl), Zeilen: Schwellenwert, Spalten: Abkühlphase")
+    print(f"{'':>8}" + "".join(f"{f'{period:g}s':>16}" for period in cool_down_periods))
+    for row, threshold in enumerate(thresholds):
+        print(f"{f'{threshold:g}%':>8}" + "".join(f"{f'{totals[row, column] / 3600:.2f}h / {counts[row, column]}':>16}"
+                                                  for column in range(len(cool_down_periods))))
+    print(f"Berechnet in {elapsed * 1000:.1f} ms")
+
+    if verify:
+        if not verify_replay(timestamps, utilization, thresholds, cool_down_periods, totals, counts):
+            return False
+        for name, (case_timestamps, case_utilization) in get_replay_edge_cases().items():
+            case_totals, case_counts = replay_grid(case_timestamps, case_utilization, thresholds, cool_down_periods)
+            if not verify_replay(case_timestamps, case_utilization, thresholds, cool_down_periods, case_totals, case_counts):
+                print(f"Abweichung im synthetischen Verlauf \"{name}\"")
+                return False
+        print("Überprüfung: alle Sitzungen stimmen mit dem Zustandsautomaten der Hauptschleife überein")
+    return True
+
+def verify_replay(timestamps, utilization, thresholds, cool_down_periods, totals, counts):
+    # Jede Kombination zusätzlich Messung für Messung mit step_session durchspielen und vergleichen
+    import numpy as np
+    expected_totals = np.zeros_like(totals)
+    expected_counts = np.zeros_like(counts)
+    for device in range(utilization.shape[1]):
+        for row, threshold in enumerate(thresholds):
+            for column, period in enumerate(cool_down_periods):
+                expected = replay_device_sessions_stepwise(timestamps, utilization[:, device], threshold, period)
+                if replay_device_sessions(timestamps, utilization[:, device], threshold, period) != expected:
+                    print(f"Abweichung: GPU {device}, Schwellenwert {threshold:g}%, Abkühlphase {period:g}s")
+                    return False
+                expected_totals[row, column] += sum(end - start for start, end in expected) / 1e6
+                expected_counts[row, column] += len(expected)
+    if not np.array_equal(counts, expected_counts) or not np.allclose(totals, expected_totals, rtol=0, atol=1e-3):
+        print("Abweichung der Summen zwischen Matrix und Zustandsautomat")
+        return False
+    return True
+
+def get_replay_edge_cases():
+    # Synthetische Verläufe für --verify mit Sonderfällen, die in den gespeicherten Messungen fehlen können
+    # (eine Minute im Sekundentakt, eine GPU pro Verlauf)
+    import numpy as np
+    timestamps = np.arange(60, dtype=np.int64) * 1000000 + 1700000000 * 1000000
+    busy_until_end = np.zeros(60, dtype=np.uint8)
+    busy_until_end[20:] = 100
+    busy_with_short_gaps = np.where(np.arange(60) % 3 == 0, 0, 100).astype(np.uint8)
+    no_values = np.full(60, SAMPLE_NO_VALUE, dtype=np.uint8)
+    no_values[10:50] = 100
+    return {
+        'immer ausgelastet': (timestamps, np.full((60, 1), 100, dtype=np.uint8)),
+        'ausgelastet bis zum Ende': (timestamps, busy_until_end[:, None]),
+        'kurze Lücken bis zum Ende': (timestamps, busy_with_short_gaps[:, None]),
+        'nie ausgelastet': (timestamps, np.zeros((60, 1), dtype=np.uint8)),
+        'ohne Werte außerhalb der Last': (timestamps, no_values[:, None])
+    }
+
+# Taktgeber der Hauptschleife. Beide Klassen bekommen ihre Uhren übergeben, damit sie sich mit einer
+# simulierten Uhr ohne echtes Warten betreiben lassen.
+class MonitorClock:
+    # Zeitstempel aus der monotonen Uhr, verankert an der Wanduhr. Sprünge der Wanduhr (NTP, Sommerzeit)
+    # werden nur übernommen, solange keine Sitzung läuft, damit Sitzungsdauern nicht verfälscht werden.
+    def __init__(self, monotonic=time.monotonic, wall=datetime.now, epoch=time.time):
+        self.monotonic = monotonic
+        self.wall = wall
+        self.epoch = epoch
+        self.anchor()
+
+    def anchor(self):
+        self.wall_anchor = self.wall()
+        self.epoch_anchor = self.epoch()
+        self.monotonic_anchor = self.monotonic()
+
+    def now(self):
+        return self.wall_anchor + timedelta(seconds=self.monotonic() - self.monotonic_anchor)
+
+    def timestamp(self):
+        # Sekunden seit der Epoche für die Messdateien. Anders als now().timestamp() springt der Wert bei der
+        # Zeitumstellung nicht zurück (die doppelte Stunde im Herbst ist als lokale Zeit mehrdeutig).
+        return self.epoch_anchor + (self.monotonic() - self.monotonic_anchor)
+
+    def resync(self):
+        if abs((self.wall() - self.now()).total_seconds()) > CLOCK_RESYNC_THRESHOLD:
+            logging.info(f"Wanduhr weicht um {(self.wall() - self.now()).total_seconds():.1f}s ab, Zeitbasis wird neu gesetzt")
+            self.anchor()
+
+    def tick(self, session_open):
+        # Zeitstempel für einen Durchlauf der Hauptschleife
+        if not session_open:
+            self.resync()
+        return self.now()
+
+class TickScheduler:
+    # Der nächste Termin ergibt sich aus dem vorherigen Termin, nicht aus dem Ende der Arbeit, so summiert sich
+    # die Laufzeit eines Durchlaufs nicht auf. War ein Durchlauf länger als das Intervall, wird nicht nachgeholt.
+    def __init__(self, monotonic=time.monotonic, sleep=time.sleep):
+        self.monotonic = monotonic
+        self.sleep = sleep
+        self.deadline = None
+        self.missed = 0
+
+    def wait(self, interval, stopped=lambda: False):
+        now = self.monotonic()
+        self.deadline = (now if self.deadline is None else self.deadline) + interval
+        if self.deadline < now:
+            self.missed += 1
+            self.deadline = now
+        # In kurzen Schritten schlafen, damit ein Stoppsignal nicht bis zum Ende eines langen Intervalls wartet
+        while True:
+            if stopped():
+                # Vorzeitig geweckt: das nächste Intervall zählt ab jetzt
+                self.deadline = min(self.deadline, self.monotonic())
+                break
+            remaining = self.deadline - self.monotonic()
+            if remaining <= 0:
+                break
+            self.sleep(min(remaining, 1))
+
+def get_min_check_interval():
+    if CONFIG.get('ADAPTIVE_SAMPLING', False):
+        return CONFIG.get('MIN_CHECK_INTERVAL', min(1, CONFIG['CHECK_INTERVAL']))
+    return CONFIG['CHECK_INTERVAL']
+
+def get_tick_interval(gpu_usage):
+    # Schnell in der Abkühlphase und nahe am Schwellenwert, langsam solange alle GPUs deutlich darunter liegen
+    if not CONFIG.get('ADAPTIVE_SAMPLING', False) or not gpu_usage:
+        return CONFIG['CHECK_INTERVAL']
+    threshold = CONFIG['GPU_USAGE_THRESHOLD']
+    margin = CONFIG.get('ADAPTIVE_MARGIN', ADAPTIVE_MARGIN)
+    values = [reading.utilization for reading in gpu_usage if reading.utilization is not None]
+    if cool_down_start or any(abs(value - threshold) <= margin for value in values):
+        return get_min_check_interval()
+    if not gpu_usage_start and is_clearly_idle(gpu_usage):
+        return CONFIG.get('IDLE_CHECK_INTERVAL', 4 * CONFIG['CHECK_INTERVAL'])
+    return CONFIG['CHECK_INTERVAL']
+
+def is_clearly_idle(gpu_usage):
+    limit = CONFIG['GPU_USAGE_THRESHOLD'] - CONFIG.get('ADAPTIVE_MARGIN', ADAPTIVE_MARGIN)
+    return all(reading.utilization < limit for reading in gpu_usage if reading.utilization is not None)
+
+def sampler_left_idle():
+    # Der Sampler misst auch im Leerlauf alle MIN_CHECK_INTERVAL Sekunden. Steigt ein Wert in die Nähe des
+    # Schwellenwerts, wird das lange Leerlaufintervall abgebrochen, statt den Anstieg bis zu
+    # IDLE_CHECK_INTERVAL Sekunden zu spät zu sehen. Nur die Arbeit der Hauptschleife ist also adaptiv.
+    with gpu_sample_lock:
+        gpu_usage = latest_gpu_usage
+    return gpu_usage is not None and not is_clearly_idle(gpu_usage)
+
+# Journal der laufenden Sitzungen (Write-Ahead), damit nach einem Absturz oder Neustart keine Sitzung verloren geht.
+# Jede Zeile ist ein Ereignis: open, cool_down, resume, close oder alive (zuletzt gesehen, solange Sitzungen laufen).
+# fsync höchstens alle JOURNAL_FSYNC_INTERVAL Sekunden, nur close wird sofort gesichert.
+class SessionJournal:
+    def __init__(self, log_dir):
+        self.path = log_dir / 'session_journal.jsonl'
+        self.file = None
+        self.last_fsync = 0
+        self.last_heartbeat = 0
+
+    def write(self, event, sync=False):
+        if self.file is None:
+            self.file = open(self.path, 'a')
+        self.file.write(json.dumps(event) + '\n')
+        self.file.flush()
+        now = time.monotonic()
+        if sync or now - self.last_fsync >= JOURNAL_FSYNC_INTERVAL:
+            os.fsync(self.file.fileno())
+            self.last_fsync = now
+
+    def open_session(self, device, start_time):
+        self.write({'event': 'open', 'device': device, 'time': start_time.isoformat()})
+
+    def start_cool_down(self, device, timestamp):
+        self.write({'event': 'cool_down', 'device': device, 'time': timestamp.isoformat()})
+
+    def cancel_cool_down(self, device, timestamp):
+        self.write({'event': 'resume', 'device': device, 'time': timestamp.isoformat()})
+
+    def close_session(self, device, start_time, end_time, duration):
+        self.write({'event': 'close', 'device': device, 'time': end_time.isoformat(),
+                    'start': start_time.isoformat(), 'duration': duration}, sync=True)
+
+    def heartbeat(self, timestamp, force=False):
+        if force or time.monotonic() - self.last_heartbeat >= JOURNAL_HEARTBEAT_INTERVAL:
+            self.write({'event': 'alive', 'time': timestamp.isoformat()}, sync=force)
+            self.last_heartbeat = time.monotonic()
+
+    def compact(self, sessions, cool_downs):
+        # Nur die noch offenen Sitzungen bleiben im Journal
+        if self.file:
+            self.file.close()
+            self.file = None
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w') as tmp_file:
+            for device, start_time in sessions.items():
+                tmp_file.write(json.dumps({'event': 'open', 'device': device, 'time': start_time.isoformat()}) + '\n')
+                if device in cool_downs:
+                    tmp_file.write(json.dumps({'event': 'cool_down', 'device': device, 'time': cool_downs[device].isoformat()}) + '\n')
+            if sessions:
+                tmp_file.write(json.dumps({'event': 'alive', 'time': datetime.now().isoformat()}) + '\n')
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.replace(tmp_path, self.path)
+        self.last_fsync = time.monotonic()
+
+    def close(self, sessions):
+        if sessions:
+            self.heartbeat(datetime.now(), force=True)
+        if self.file:
+            self.file.close()
+            self.file = None
+
+def replay_session_journal(path):
+    # Liefert offene Sitzungen, laufende Abkühlphasen, abgeschlossene Sitzungen und den letzten bekannten Zeitpunkt
+    sessions = {}
+    cool_downs = {}
+    closed = []
+    last_seen = None
+    try:
+        journal_file = open(path, 'r')
+    except FileNotFoundError:
+        return sessions, cool_downs, closed, last_seen
+    with journal_file:
+        for line in journal_file:
+            try:
+                event = json.loads(line)
+                timestamp = datetime.fromisoformat(event['time'])
+            except (ValueError, KeyError):
+                # Unvollständige letzte Zeile nach einem Absturz
+                continue
+            last_seen = timestamp if last_seen is None else max(last_seen, timestamp)
+            device = event.get('device')
+            if event['event'] == 'open':
+                sessions[device] = timestamp
+                cool_downs.pop(device, None)
+            elif event['event'] == 'cool_down':
+                cool_downs[device] = timestamp
+            elif event['event'] == 'resume':
+                cool_downs.pop(device, None)
+            elif event['event'] == 'close':
+                sessions.pop(device, None)
+                cool_downs.pop(device, None)
+                closed.append((device, datetime.fromisoformat(event['start']), timestamp, event['duration']))
+    return sessions, cool_downs, closed, last_seen
+
+def is_session_logged(device, start_time, log_dir=None):
+    rows = iter_log_rows('gpu_usage_log', start_time, start_time + timedelta(microseconds=1), log_dir)
+    return any(int(row.get('GPU') or 0) == device for row in rows)
+
+def log_recovered_session(device, start_time, end_time, duration):
+    # Sitzungen nur einmal eintragen, auch wenn der Absturz direkt nach dem CSV-Eintrag kam
+    if is_session_logged(device, start_time):
         return
+    log_gpu_usage(device, start_time, end_time, duration)
+    update_notion(device, start_time, end_time, duration)
+    update_fleet(device, start_time, end_time, duration)
+    logging.info(f"Sitzung auf GPU {device} von {start_time} bis {end_time} aus dem Journal nachgetragen")
+
+def recover_sessions(journal):
+    sessions, cool_downs, closed, last_seen = replay_session_journal(journal.path)
+    for device, start_time, end_time, duration in closed:
+        log_recovered_session(device, start_time, end_time, duration)
+
+    now = datetime.now()
+    for device, start_time in sessions.items():
+        if (now - last_seen).total_seconds() <= CONFIG['COOL_DOWN_PERIOD']:
+            # Kurzer Neustart: die Sitzung läuft einfach weiter
+            gpu_usage_start[device] = start_time
+            if device in cool_downs:
+                cool_down_start[device] = cool_downs[device]
+            logging.info(f"Sitzung auf GPU {device} seit {start_time} wird fortgesetzt")
+        else:
+            # Sonst endet sie mit der Abkühlphase bzw. zum letzten bekannten Zeitpunkt
+            end_time = cool_downs.get(device, last_seen)
+            log_recovered_session(device, start_time, end_time, (end_time - start_time).total_seconds())
+    journal.compact(gpu_usage_start, cool_down_start)
+
+# Zuordnung der GPU-Zeit zu Prozessen und Benutzern. Prozesse werden über (PID, Startzeit) identifiziert,
+# damit eine wiederverwendete PID nicht mit einem früheren Prozess zusammengeführt wird.
+session_attribution = defaultdict(dict)
+# Zeit aus der Abkühlphase; sie liegt hinter dem geloggten Sitzungsende und zählt erst, wenn die Sitzung weiterläuft
+cool_down_attribution = defaultdict(dict)
+attribution_process_cache = {}
+
+def get_attribution_entry(pid):
+    cached = attribution_process_cache.get(pid)
+    if cached is not None and cached[0].is_running():
+        return cached[1]
     try:
-        url = f"https://api.notion.com/v1/pages"
-        headers = {
-            "Authorization": f"Bearer {CONFIG['NOTION_TOKEN']}",
-            "Content-Type": "application/json",
-            "Notion-Version": "2021-05-13"
-        }
-        data = {
-            "parent": {"database_id": CONFIG['NOTION_DATABASE_ID']},
-            "properties": {
-                "Start Time": {"date": {"start": start_time.isoformat()}},
-                "End Time": {"date": {"start": end_time.isoformat()}},
-                "Duration (min)": {"number": round(duration/60, 2)},
-            }
+        process = psutil.Process(pid)
+        create_time = process.create_time()
+    except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+        return None
+    try:
+        with process.oneshot():
+            user = process.username()
+            command = ' '.join(process.cmdline()) or process.name()
+    except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+        user, command = None, None
+    entry = ((pid, create_time), user, command)
+    attribution_process_cache[pid] = (process, entry)
+    return entry
+
+def add_attribution(entries, key, seconds, user, command):
+    entries[key] = (entries.get(key, (0, user, command))[0] + seconds, user, command)
+
+def attribute_gpu_usage(gpu_usage, elapsed):
+    compute_apps = get_compute_apps()
+    apps_by_bus_id = defaultdict(list)
+    for app in compute_apps:
+        apps_by_bus_id[app.bus_id].append(app)
+
+    for reading in gpu_usage:
+        device_apps = apps_by_bus_id.get(reading.bus_id)
+        if reading.index not in gpu_usage_start or not reading.utilization or not device_apps:
+            continue
+        target = cool_down_attribution if reading.index in cool_down_start else session_attribution
+        # Die ausgelastete Zeit der GPU wird nach belegtem Speicher auf ihre Prozesse aufgeteilt
+        busy_seconds = elapsed * reading.utilization / 100
+        total_memory = sum(app.used_memory or 0 for app in device_apps)
+        for app in device_apps:
+            entry = get_attribution_entry(app.pid)
+            if entry is None:
+                continue
+            share = (app.used_memory or 0) / total_memory if total_memory else 1 / len(device_apps)
+            key, user, command = entry
+            add_attribution(target[reading.index], key, busy_seconds * share, user, command)
+
+    active_pids = {app.pid for app in compute_apps}
+    for pid in list(attribution_process_cache):
+        if pid not in active_pids:
+            del attribution_process_cache[pid]
+
+def settle_cool_down_attribution():
+    # Nach den Sitzungsschritten: bei beendeter Sitzung verfällt die Zeit der Abkühlphase, läuft sie weiter, wird sie übernommen
+    for device in list(cool_down_attribution):
+        if device not in gpu_usage_start:
+            del cool_down_attribution[device]
+        elif device not in cool_down_start:
+            for key, (seconds, user, command) in cool_down_attribution.pop(device).items():
+                add_attribution(session_attribution[device], key, seconds, user, command)
+
+def log_gpu_attribution(device, start_time, end_time):
+    cool_down_attribution.pop(device, None)
+    entries = session_attribution.pop(device, {})
+    if not entries:
+        return
+    date_str = start_time.strftime("%Y-%m-%d")
+    log_file = CONFIG['LOG_DIR'] / f"gpu_attribution_log_{date_str}.csv"
+    rows = []
+    seconds_by_user = defaultdict(float)
+    for (pid, create_time), (seconds, user, command) in sorted(entries.items(), key=lambda item: -item[1][0]):
+        rows.append([start_time, end_time, device, pid, datetime.fromtimestamp(create_time), user, command, round(seconds, 3)])
+        seconds_by_user[user or ''] += seconds
+    log_rows_to_csv(log_file, rows, ATTRIBUTION_LOG_HEADERS)
+    add_attribution_to_ledger(log_file, start_time, seconds_by_user)
+
+# Sitzungen für Notion werden zuerst in einen Spool auf der Festplatte geschrieben und von dort
+# gesammelt hochgeladen. So geht bei Netzwerkfehlern oder einem Neustart nichts verloren.
+spool_lock = threading.Lock()
+# Ob die Datenbank eine Text-Eigenschaft "Session ID" hat; None, solange das Schema noch nicht geprüft wurde
+notion_deduplicate = None
+
+def get_notion_spool_path():
+    return CONFIG['LOG_DIR'] / 'notion_spool.jsonl'
+
+def get_session_id(device, start_time):
+    # Eindeutiger Schlüssel einer Sitzung, damit ein erneuter Upload keine doppelten Einträge erzeugt
+    return f"{start_time.isoformat()}#GPU{device}"
+
+def make_session_record(device, start_time, end_time, duration):
+    return {
+        'id': get_session_id(device, start_time),
+        'device': device,
+        'start_time': start_time.isoformat(),
+        'end_time': end_time.isoformat(),
+        'duration': duration
+    }
+
+def read_spool(spool_path):
+    try:
+        with open(spool_path, 'r') as spool_file:
+            return [json.loads(line) for line in spool_file if line.strip()]
+    except FileNotFoundError:
+        return []
+
+def append_to_spool(spool_path, records):
+    with spool_lock:
+        with open(spool_path, 'a') as spool_file:
+            for record in records:
+                spool_file.write(json.dumps(record) + '\n')
+            spool_file.flush()
+            os.fsync(spool_file.fileno())
+
+def remove_from_spool(spool_path, record_ids):
+    with spool_lock:
+        remaining = [record for record in read_spool(spool_path) if record['id'] not in record_ids]
+        tmp_path = spool_path.with_name(spool_path.name + '.tmp')
+        with open(tmp_path, 'w') as tmp_file:
+            for record in remaining:
+                tmp_file.write(json.dumps(record) + '\n')
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.replace(tmp_path, spool_path)
+
+def read_notion_spool():
+    return read_spool(get_notion_spool_path())
+
+def append_to_notion_spool(records):
+    append_to_spool(get_notion_spool_path(), records)
+
+def remove_from_notion_spool(record_ids):
+    remove_from_spool(get_notion_spool_path(), record_ids)
+
+def get_notion_headers():
+    return {
+        "Authorization": f"Bearer {CONFIG['NOTION_TOKEN']}",
+        "Content-Type": "application/json",
+        "Notion-Version": "2021-05-13"
+    }
+
+def get_notion_url(path):
+    return f"{CONFIG.get('NOTION_API_URL', 'https://api.notion.com/v1')}/{path}"
+
+def check_notion_schema():
+    # Einmal pro Start: ohne "Session ID" schlagen Abfrage und Anlegen der Seiten immer fehl und der Spool wächst.
+    # Dann wird ohne Prüfung auf doppelte Einträge hochgeladen.
+    global notion_deduplicate
+    response = get_http_session().get(get_notion_url(f"databases/{CONFIG['NOTION_DATABASE_ID']}"), headers=get_notion_headers(), timeout=NOTIFY_TIMEOUT)
+    if response.status_code != 200:
+        raise Exception(f"Notion API returned status code {response.status_code}: {response.text}")
+    session_id = response.json().get('properties', {}).get('Session ID')
+    notion_deduplicate = session_id is not None and session_id.get('type') == 'rich_text'
+    if not notion_deduplicate:
+        log_error("Die Notion-Datenbank hat keine Eigenschaft \"Session ID\" vom Typ Text. Bitte in Notion hinzufügen und "
+                  "das Skript neu starten; bis dahin werden Sitzungen ohne Prüfung auf doppelte Einträge hochgeladen.")
+    return notion_deduplicate
+
+def find_existing_notion_sessions(session_ids):
+    url = get_notion_url(f"databases/{CONFIG['NOTION_DATABASE_ID']}/query")
+    data = {
+        "filter": {"or": [{"property": "Session ID", "text": {"equals": session_id}} for session_id in session_ids]},
+        "page_size": 100
+    }
+    response = get_http_session().post(url, headers=get_notion_headers(), json=data, timeout=NOTIFY_TIMEOUT)
+    if response.status_code != 200:
+        raise Exception(f"Notion API returned status code {response.status_code}: {response.text}")
+    existing = set()
+    for page in response.json().get('results', []):
+        for text in page['properties'].get('Session ID', {}).get('rich_text', []):
+            existing.add(text['plain_text'])
+    return existing
+
+def post_notion_page(record):
+    data = {
+        "parent": {"database_id": CONFIG['NOTION_DATABASE_ID']},
+        "properties": {
+            "Start Time": {"date": {"start": record['start_time']}},
+            "End Time": {"date": {"start": record['end_time']}},
+            "Duration (min)": {"number": round(record['duration']/60, 2)},
         }
-        response = requests.post(url, headers=headers, json=data)
-        if response.status_code != 200:
-            raise Exception(f"Notion API returned status code {response.status_code}: {response.text}")
+    }
+    if notion_deduplicate:
+        data["properties"]["Session ID"] = {"rich_text": [{"text": {"content": record['id']}}]}
+    response = get_http_session().post(get_notion_url('pages'), headers=get_notion_headers(), json=data, timeout=NOTIFY_TIMEOUT)
+    if response.status_code != 200:
+        raise Exception(f"Notion API returned status code {response.status_code}: {response.text}")
+
+def replay_notion_spool():
+    if notion_deduplicate is None:
+        check_notion_schema()
+    records = read_notion_spool()
+    uploaded = 0
+    for i in range(0, len(records), NOTION_BATCH_SIZE):
+        batch = records[i:i + NOTION_BATCH_SIZE]
+        # Sitzungen, die schon in Notion stehen (z.B. nach einem Abbruch mitten im Batch), werden übersprungen
+        existing = find_existing_notion_sessions([record['id'] for record in batch]) if notion_deduplicate else set()
+        for record in batch:
+            if record['id'] not in existing:
+                post_notion_page(record)
+                uploaded += 1
+        remove_from_notion_spool({record['id'] for record in batch})
+    if uploaded:
+        logging.info(f"{uploaded} Sitzungen zu Notion hochgeladen")
+    return uploaded
+
+def update_notion(device, start_time, end_time, duration):
+    if not CONFIG.get('ENABLE_NOTION', False):
+        return
+    try:
+        append_to_notion_spool([make_session_record(device, start_time, end_time, duration)])
     except Exception as e:
-        log_error(f"Fehler beim Aktualisieren von Notion: {str(e)}")
+        log_error(f"Fehler beim Schreiben in den Notion-Spool: {str(e)}")
+    enqueue_notification('notion', None)
+
+def backfill_notion():
+    # Alle Sitzungen aus den CSV-Logs, die in Notion fehlen, nachträglich hochladen
+    if not check_notion_schema():
+        print("Ohne die Eigenschaft \"Session ID\" lassen sich fehlende Sitzungen nicht erkennen, es wurde nichts hochgeladen.")
+        return
+    spooled_ids = {record['id'] for record in read_notion_spool()}
+    records = [make_session_record(*row) for row in iter_usage_log_rows()]
+    append_to_notion_spool([record for record in records if record['id'] not in spooled_ids])
+    uploaded = replay_notion_spool()
+    print(f"{len(records)} Sitzungen geprüft, {uploaded} fehlende Sitzungen zu Notion hochgeladen.")
 
 def reset_total_time():
-    global last_reset_date, filtered_total
-    last_reset_date = datetime.now()
-    filtered_total = 0
-    CONFIG['last_reset_date'] = last_reset_date.isoformat()
-    save_config()
+    global last_reset_date, filtered_total, device_totals, user_totals
+    with ledger_lock:
+        last_reset_date = datetime.now()
+        filtered_total = 0
+        device_totals = {}
+        user_totals = {}
+        save_ledger()
+    set_state('last_reset_date', last_reset_date.isoformat())
+    flush_state()
     if CONFIG.get('ENABLE_TELEGRAM', False):
         send_telegram_message(f"🔄 *Gesamtzeit zurückgesetzt*\nNeues Startdatum: {last_reset_date.strftime('%Y-%m-%d')}")
 
 
+# Lokale HTTP-API für das Dashboard: liefert Sitzungen, Messungen und Summen für einen Zeitbereich als JSON
+csv_cache = {}
+csv_cache_lock = threading.Lock()
+
+def read_csv_cached(path):
+    # Geparste CSV-Dateien werden zwischengespeichert, solange sich Größe und Änderungszeit nicht ändern
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return []
+    with csv_cache_lock:
+        cached = csv_cache.get(path)
+        if cached and cached[0] == (stat.st_mtime_ns, stat.st_size):
+            return cached[1]
+    with open_log_file(path) as file:
+        rows = list(csv.DictReader(file))
+    with csv_cache_lock:
+        if len(csv_cache) >= CSV_CACHE_SIZE:
+            csv_cache.pop(next(iter(csv_cache)))
+        csv_cache[path] = ((stat.st_mtime_ns, stat.st_size), rows)
+    return rows
+
+def iter_days(start_time, end_time):
+    day = start_time.date()
+    while day <= end_time.date():
+        yield day
+        day += timedelta(days=1)
+
+def in_range(row, start_time, end_time, key='Timestamp'):
+    try:
+        return start_time <= datetime.fromisoformat(row[key]) < end_time
+    except (KeyError, TypeError, ValueError):
+        return False
+
+def query_sessions(start_time, end_time):
+    with log_files_lock:
+        log_files = get_log_files('gpu_usage_log', start_time, end_time)
+        return [row for log_file in log_files for row in read_csv_cached(log_file) if in_range(row, start_time, end_time, 'Start Time')]
+
+def bucket_overlaps(row, resolution, start_time, end_time):
+    # Ein Intervall gehört zum Bereich, sobald es ihn berührt, auch wenn es vor start_time beginnt (z.B. am Tag des Resets)
+    try:
+        bucket_start = datetime.fromisoformat(row['Timestamp'])
+    except (KeyError, TypeError, ValueError):
+        return False
+    return bucket_start + ROLLUP_STEPS[resolution] > start_time and bucket_start < end_time
+
+def query_rollups(resolution, start_time, end_time):
+    paths = []
+    for day in iter_days(start_time, end_time):
+        path = get_rollup_path(CONFIG['LOG_DIR'], resolution, datetime.combine(day, datetime.min.time()))
+        if path not in paths:
+            paths.append(path)
+    rows = [row for path in paths for row in read_csv_cached(path) if bucket_overlaps(row, resolution, start_time, end_time)]
+    # Das laufende Intervall steht höchstens mit seinem letzten Zwischenstand in der Datei
+    if rollups:
+        bucket_start, bucket = rollups.get_open_buckets().get(resolution, (None, None))
+        if bucket is not None and bucket_start + ROLLUP_STEPS[resolution] > start_time and bucket_start < end_time:
+            rows = [row for row in rows if datetime.fromisoformat(row['Timestamp']) != bucket_start]
+            rows.append(dict(zip(ROLLUP_HEADERS, format_rollup_row(bucket_start, bucket))))
+    return rows
+
+def query_samples(start_time, end_time):
+    return [{
+        'Timestamp': datetime.fromtimestamp(timestamp),
+        'GPU Usage': get_mean_value(utilization),
+        'CPU Usage': round(cpu_usage, 1),
+        'RAM Usage': round(ram_usage, 1),
+        'GPU Devices': utilization
+    } for timestamp, cpu_usage, ram_usage, utilization in read_samples(start_time, end_time)]
+
+def query_totals():
+    snapshot = get_snapshot()
+    return {
+        'last_reset_date': snapshot.last_reset_date.isoformat(),
+        'total': snapshot.total,
+        'devices': dict(snapshot.device_totals),
+        'users': dict(snapshot.user_totals)
+    }
+
+# Prometheus-Metriken aus dem letzten Stand der Hauptschleife. Ein Scrape ruft weder nvidia-smi auf noch liest er Logs,
+# der Text wird pro Stand nur einmal erzeugt.
+metrics_cache = (None, None)
+
+def escape_metric_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def render_metrics(snapshot):
+    lines = []
+
+    def add_metric(name, metric_type, description, samples):
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for labels, value in samples:
+            if value is None:
+                continue
+            label_text = ",".join(f'{key}="{escape_metric_label(label)}"' for key, label in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+    readings = snapshot.gpu_usage or ()
+    gpu_labels = [({'gpu': reading.index, 'bus_id': reading.bus_id}, reading) for reading in readings]
+    add_metric('gpu_monitor_gpu_utilization_percent', 'gauge', 'GPU utilization in percent',
+               [(labels, reading.utilization) for labels, reading in gpu_labels])
+    add_metric('gpu_monitor_gpu_memory_used_mebibytes', 'gauge', 'Used GPU memory in MiB',
+               [(labels, reading.memory_used) for labels, reading in gpu_labels])
+    add_metric('gpu_monitor_gpu_memory_total_mebibytes', 'gauge', 'Total GPU memory in MiB',
+               [(labels, reading.memory_total) for labels, reading in gpu_labels])
+    add_metric('gpu_monitor_gpu_power_draw_watts', 'gauge', 'GPU power draw in watts',
+               [(labels, reading.power_draw) for labels, reading in gpu_labels])
+    add_metric('gpu_monitor_gpu_session_active', 'gauge', 'Whether a usage session is running on the GPU',
+               [({'gpu': reading.index}, int(reading.index in snapshot.active_sessions)) for reading in readings])
+    add_metric('gpu_monitor_gpu_session_start_timestamp_seconds', 'gauge', 'Start of the running usage session',
+               [({'gpu': device}, start.timestamp()) for device, start in sorted(snapshot.active_sessions.items())])
+    add_metric('gpu_monitor_gpu_busy_seconds_total', 'counter', 'Time in finished usage sessions since the last reset',
+               [({'gpu': device}, total) for device, total in sorted(snapshot.device_totals.items())])
+    add_metric('gpu_monitor_busy_seconds_total', 'counter', 'Time in finished usage sessions of all GPUs since the last reset',
+               [({}, snapshot.total)])
+    add_metric('gpu_monitor_user_gpu_seconds_total', 'counter', 'GPU seconds attributed to a user since the last reset',
+               [({'user': user}, total) for user, total in sorted(snapshot.user_totals.items())])
+    add_metric('gpu_monitor_last_reset_timestamp_seconds', 'gauge', 'Time of the last reset of the totals',
+               [({}, snapshot.last_reset_date.timestamp())])
+    add_metric('gpu_monitor_cpu_usage_percent', 'gauge', 'CPU usage in percent', [({}, snapshot.cpu_usage)])
+    add_metric('gpu_monitor_ram_usage_percent', 'gauge', 'RAM usage in percent', [({}, snapshot.ram_usage)])
+    add_metric('gpu_monitor_sample_timestamp_seconds', 'gauge', 'Time of the last sample', [({}, snapshot.timestamp.timestamp())])
+    return ("\n".join(lines) + "\n").encode('utf-8')
+
+def get_metrics():
+    global metrics_cache
+    snapshot = get_snapshot()
+    cached_snapshot, body = metrics_cache
+    if cached_snapshot is not snapshot:
+        body = render_metrics(snapshot)
+        metrics_cache = (snapshot, body)
+    return body
+
+def make_request_handler():
+    # http.server wird erst beim Start der API geladen, das spart Zeit beim Start ohne API (--headless)
+    from http.server import BaseHTTPRequestHandler
+
+    class MonitorRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+            try:
+                if url.path in ('/', '/dashboard.html'):
+                    with open(Path(__file__).parent / 'dashboard.html', 'rb') as file:
+                        self.send_body(file.read(), 'text/html; charset=utf-8')
+                    return
+                if url.path == '/settings.json':
+                    self.send_json(state)
+                    return
+                if url.path == '/api/totals':
+                    self.send_json(query_totals())
+                    return
+                if url.path == '/metrics' and CONFIG.get('ENABLE_METRICS', False):
+                    self.send_body(get_metrics(), 'text/plain; version=0.0.4; charset=utf-8')
+                    return
+
+                end_time = datetime.fromisoformat(query['end']) if 'end' in query else datetime.now() + timedelta(days=1)
+                start_time = datetime.fromisoformat(query['start']) if 'start' in query else last_reset_date
+                if url.path == '/api/sessions':
+                    self.send_json(query_sessions(start_time, end_time))
+                elif url.path == '/api/samples':
+                    resolution = query.get('resolution', 'raw')
+                    if resolution == 'raw':
+                        self.send_json(query_samples(start_time, end_time))
+                    elif resolution == 'live':
+                        points = int(query.get('points', LIVE_DEFAULT_POINTS))
+                        self.send_json(query_live_samples(start_time, end_time, points, query.get('method', 'lttb')))
+                    elif resolution in ROLLUP_RESOLUTIONS:
+                        self.send_json(query_rollups(resolution, start_time, end_time))
+                    else:
+                        self.send_error(400, f"Unbekannte Auflösung: {resolution}")
+                else:
+                    self.send_error(404)
+            except ValueError as e:
+                self.send_error(400, str(e))
+            except Exception as e:
+                logging.exception(f"Fehler bei der HTTP-Anfrage {self.path}")
+                self.send_error(500, str(e))
+
+        def send_json(self, data):
+            self.send_body(json.dumps(data, default=str).encode('utf-8'), 'application/json')
+
+        def send_body(self, body, content_type):
+            # ETag aus dem Inhalt: ein unveränderter Bereich wird bei erneuter Abfrage mit 304 beantwortet
+            etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+            if etag in self.headers.get('If-None-Match', ''):
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            if 'gzip' in self.headers.get('Accept-Encoding', '') and len(body) > 512:
+                body = gzip.compress(body, compresslevel=5)
+                content_encoding = 'gzip'
+            else:
+                content_encoding = None
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Vary', 'Accept-Encoding')
+            if content_encoding:
+                self.send_header('Content-Encoding', content_encoding)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug(f"HTTP {self.address_string()} {format % args}")
+
+    return MonitorRequestHandler
+
+def start_http_server():
+    global http_server
+    from http.server import ThreadingHTTPServer
+    http_server = ThreadingHTTPServer((CONFIG.get('HTTP_HOST', '127.0.0.1'), CONFIG.get('HTTP_PORT', 8765)), make_request_handler())
+    http_server.daemon_threads = True
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    logging.info(f"HTTP-API läuft auf http://{http_server.server_address[0]}:{http_server.server_address[1]}/")
+
+def stop_http_server():
+    if http_server:
+        http_server.shutdown()
+        http_server.server_close()
+
+# Flottenbetrieb: Agenten schicken Messungen und abgeschlossene Sitzungen gesammelt und mit gzip komprimiert an einen
+# Collector (python monitor.py --collector), der viele Rechner gleichzeitig annimmt und Summen über alle Rechner liefert.
+# Sitzungen bleiben bis zur Bestätigung im Spool fleet_spool.jsonl, Messungen nur im Speicher (höchstens
+# FLEET_MAX_PENDING_SAMPLES, bei längerem Ausfall des Collectors gehen die ältesten verloren).
+fleet_samples = deque(maxlen=FLEET_MAX_PENDING_SAMPLES)
+fleet_lock = threading.Lock()
+fleet_wakeup = threading.Event()
+fleet_stopping = threading.Event()
+fleet_thread = None
+
+def get_fleet_host():
+    return CONFIG.get('FLEET_HOST') or socket.gethostname()
+
+def get_fleet_spool_path():
+    return CONFIG['LOG_DIR'] / 'fleet_spool.jsonl'
+
+def add_fleet_sample(timestamp, cpu_usage, ram_usage, gpu_usage):
+    with fleet_lock:
+        fleet_samples.append([timestamp, cpu_usage, ram_usage, [[reading.index, reading.utilization] for reading in gpu_usage]])
+
+def update_fleet(device, start_time, end_time, duration):
+    if not CONFIG.get('FLEET_COLLECTOR_URL'):
+        return
+    try:
+        append_to_spool(get_fleet_spool_path(), [make_session_record(device, start_time, end_time, duration)])
+    except Exception as e:
+        log_error(f"Fehler beim Schreiben in den Flotten-Spool: {str(e)}")
+    # Sitzungen sofort schicken, Messungen erst mit dem nächsten Intervall
+    fleet_wakeup.set()
+
+def get_fleet_status():
+    snapshot = get_snapshot()
+    return {
+        'timestamp': snapshot.timestamp.isoformat(),
+        'gpu_usage': [reading._asdict() for reading in snapshot.gpu_usage or ()],
+        'cpu_usage': snapshot.cpu_usage,
+        'ram_usage': snapshot.ram_usage,
+        'active_sessions': {str(device): start.isoformat() for device, start in snapshot.active_sessions.items()}
+    }
+
+def push_fleet_batch():
+    # Ein Paket mit bis zu FLEET_BATCH_SIZE Messungen, allen Sitzungen aus dem Spool und dem aktuellen Stand.
+    # Gibt True zurück, wenn noch weitere Messungen warten.
+    with fleet_lock:
+        samples = list(fleet_samples)[:FLEET_BATCH_SIZE]
+    sessions = read_spool(get_fleet_spool_path())
+    payload = {'host': get_fleet_host(), 'samples': samples, 'sessions': sessions, 'status': get_fleet_status()}
+    headers = {'Content-Type': 'application/json', 'Content-Encoding': 'gzip'}
+    if CONFIG.get('FLEET_TOKEN'):
+        headers['Authorization'] = f"Bearer {CONFIG['FLEET_TOKEN']}"
+    url = CONFIG['FLEET_COLLECTOR_URL'].rstrip('/') + '/api/fleet/ingest'
+    response = get_http_session().post(url, data=gzip.compress(json.dumps(payload).encode('utf-8')), headers=headers, timeout=NOTIFY_TIMEOUT)
+    if response.status_code != 200:
+        raise Exception(f"Collector antwortete mit Status {response.status_code}: {response.text}")
+    if sessions:
+        remove_from_spool(get_fleet_spool_path(), {record['id'] for record in sessions})
+    with fleet_lock:
+        # Nur die geschickten Messungen entfernen; neue können inzwischen hinzugekommen oder alte herausgefallen sein
+        while samples and fleet_samples and fleet_samples[0][0] <= samples[-1][0]:
+            fleet_samples.popleft()
+        return len(fleet_samples) > 0 and len(samples) == FLEET_BATCH_SIZE
+
+def fleet_push_loop():
+    interval = CONFIG.get('FLEET_PUSH_INTERVAL', FLEET_PUSH_INTERVAL)
+    delay = interval
+    failures = 0
+    while True:
+        fleet_wakeup.wait(delay)
+        fleet_wakeup.clear()
+        try:
+            while push_fleet_batch():
+                pass
+            failures = 0
+            delay = interval
+        except Exception as e:
+            # Bei Fehlern mit wachsendem Abstand erneut versuchen, die Daten bleiben solange liegen
+            delay = min(2 ** failures, FLEET_MAX_BACKOFF)
+            failures += 1
+            logging.error(f"Fehler beim Senden an den Collector (Versuch {failures}), neuer Versuch in {delay}s: {str(e)}")
+            count_event('fleet_retry')
+        # Kam während des Sendens noch etwas hinzu, wird vor dem Beenden ein weiteres Paket geschickt
+        if fleet_stopping.is_set() and not fleet_wakeup.is_set():
+            break
+
+def start_fleet_agent():
+    global fleet_thread
+    fleet_thread = threading.Thread(target=fleet_push_loop, daemon=True)
+    fleet_thread.start()
+    logging.info(f"Sende Messungen als {get_fleet_host()} an {CONFIG['FLEET_COLLECTOR_URL']}")
+
+def stop_fleet_agent(timeout=NOTIFY_TIMEOUT):
+    # Ein letztes Paket schicken, aber höchstens `timeout` Sekunden warten
+    if fleet_thread is None or not fleet_thread.is_alive():
+        return
+    fleet_stopping.set()
+    fleet_wakeup.set()
+    fleet_thread.join(timeout)
+
+class FleetHost:
+    # Zustand eines Agenten im Collector. Die Sitzungen liegen wie bei einem einzelnen Rechner als
+    # gpu_usage_log_*.csv in LOG_DIR/fleet/<Rechner>, die Messungen als samples_*.bin.
+    def __init__(self, name, log_dir):
+        import asyncio
+        self.name = name
+        self.log_dir = log_dir
+        self.lock = asyncio.Lock()
+        self.sample_store = SampleStore(log_dir)
+        self.device_totals = {}
+        self.status = None
+        self.last_seen = None
+        self.last_sample = None
+
+    def load(self):
+        self.device_totals = {int(device): total for device, total in scan_log_totals('gpu_usage_log', last_reset_date, self.log_dir).items()}
+        # Nach einem Neustart des Collectors schickt ein Agent bereits gespeicherte Messungen erneut, wenn die
+        # Bestätigung verloren ging; ohne den letzten Zeitstempel würden sie doppelt gespeichert
+        for sample_file in sorted(self.log_dir.glob('samples_*.bin'), reverse=True):
+            self.last_sample = read_last_sample_timestamp(sample_file)
+            if self.last_sample is not None:
+                break
+
+    def ingest(self, payload):
+        # Läuft in einem Worker-Thread; pro Rechner wird immer nur ein Paket gleichzeitig verarbeitet
+        new_sessions = []
+        for record in payload.get('sessions', []):
+            device = int(record['device'])
+            start_time = datetime.fromisoformat(record['start_time'])
+            end_time = datetime.fromisoformat(record['end_time'])
+            duration = float(record['duration'])
+            # Ein Paket, dessen Bestätigung verloren ging, kommt erneut an: Sitzungen nur einmal eintragen
+            if is_session_logged(device, start_time, self.log_dir):
+                continue
+            with fleet_lock:
+                if start_time >= last_reset_date:
+                    self.device_totals[device] = self.device_totals.get(device, 0) + duration
+                device_total = self.device_totals.get(device, 0)
+            log_to_csv(self.log_dir / f"gpu_usage_log_{start_time.strftime('%Y-%m-%d')}.csv",
+                       [start_time, end_time, duration, device, device_total], USAGE_LOG_HEADERS)
+            new_sessions.append((device, start_time, duration))
+
+        sample_count = 0
+        for timestamp, cpu_usage, ram_usage, utilization in payload.get('samples', []):
+            if self.last_sample is not None and timestamp <= self.last_sample:
+                continue
+            readings = [GpuReading(index, value, None, None, None, None) for index, value in utilization]
+            self.sample_store.append(timestamp, cpu_usage, ram_usage, readings)
+            self.last_sample = timestamp
+            sample_count += 1
+
+        with fleet_lock:
+            self.status = payload.get('status')
+            self.last_seen = datetime.now()
+        for device, start_time, duration in new_sessions:
+            send_telegram_message(f"🧊 {self.name} GPU {device}: Sitzung von {start_time.strftime('%Y-%m-%d %H:%M')} beendet\n"
+                                  f"Dauer: {duration:.2f}s\nGesamtsumme Flotte: {get_fleet_total():.2f}s")
+        return {'sessions': len(new_sessions), 'samples': sample_count}
+
+    def get_totals(self):
+        return {
+            'total': sum(self.device_totals.values()),
+            'devices': dict(self.device_totals),
+            'last_seen': self.last_seen.isoformat() if self.last_seen else None,
+            'status': self.status
+        }
+
+fleet_hosts = {}
+
+def get_fleet_dir():
+    return CONFIG['LOG_DIR'] / 'fleet'
+
+def is_valid_host_name(name):
+    # Der Name wird zum Verzeichnisnamen, daher nur einfache Zeichen
+    return isinstance(name, str) and 0 < len(name) <= 64 and name[0] != '.' and all(char.isalnum() or char in '-_.' for char in name)
+
+def get_fleet_host_entry(name):
+    host = fleet_hosts.get(name)
+    if host is None:
+        log_dir = get_fleet_dir() / name
+        log_dir.mkdir(parents=True, exist_ok=True)
+        host = FleetHost(name, log_dir)
+        with fleet_lock:
+            fleet_hosts[name] = host
+    return host
+
+def load_fleet_hosts():
+    get_fleet_dir().mkdir(parents=True, exist_ok=True)
+    for log_dir in sorted(get_fleet_dir().iterdir()):
+        if log_dir.is_dir() and is_valid_host_name(log_dir.name):
+            get_fleet_host_entry(log_dir.name).load()
+    logging.info(f"{len(fleet_hosts)} Rechner aus {get_fleet_dir()} geladen")
+
+def get_fleet_total():
+    with fleet_lock:
+        return sum(sum(host.device_totals.values()) for host in fleet_hosts.values())
+
+def query_fleet_totals():
+    with fleet_lock:
+        hosts = {name: host.get_totals() for name, host in sorted(fleet_hosts.items())}
+    return {
+        'last_reset_date': last_reset_date.isoformat(),
+        'total': sum(host['total'] for host in hosts.values()),
+        'hosts': hosts
+    }
+
+def query_fleet_sessions(host_names, start_time, end_time):
+    sessions = []
+    for name in host_names:
+        for row in iter_log_rows('gpu_usage_log', start_time, end_time, fleet_hosts[name].log_dir):
+            row['Host'] = name
+            sessions.append(row)
+    return sessions
+
+def decode_fleet_payload(headers, body):
+    if headers.get('content-encoding') == 'gzip':
+        body = gzip.decompress(body)
+    return json.loads(body)
+
+async def handle_fleet_request(method, target, headers, body):
+    import asyncio
+    loop = asyncio.get_event_loop()
+    url = urlparse(target)
+    query = {key: values[0] for key, values in parse_qs(url.query).items()}
+    token = CONFIG.get('FLEET_TOKEN')
+    if token and headers.get('authorization') != f"Bearer {token}":
+        return 401, {'error': 'Ungültiges Token'}
+
+    if method == 'POST' and url.path == '/api/fleet/ingest':
+        payload = await loop.run_in_executor(None, decode_fleet_payload, headers, body)
+        name = payload.get('host')
+        if not is_valid_host_name(name):
+            return 400, {'error': f"Ungültiger Rechnername: {name}"}
+        host = get_fleet_host_entry(name)
+        async with host.lock:
+            return 200, await loop.run_in_executor(None, host.ingest, payload)
+    if method != 'GET':
+        return 405, {'error': f"Methode {method} wird nicht unterstützt"}
+    if url.path == '/api/fleet':
+        return 200, query_fleet_totals()
+
+    if 'host' in query and query['host'] not in fleet_hosts:
+        return 404, {'error': f"Unbekannter Rechner: {query['host']}"}
+    end_time = datetime.fromisoformat(query['end']) if 'end' in query else datetime.now() + timedelta(days=1)
+    start_time = datetime.fromisoformat(query['start']) if 'start' in query else last_reset_date
+    if url.path == '/api/fleet/sessions':
+        host_names = [query['host']] if 'host' in query else sorted(fleet_hosts)
+        return 200, await loop.run_in_executor(None, query_fleet_sessions, host_names, start_time, end_time)
+    if url.path == '/api/fleet/samples' and 'host' in query:
+        samples = await loop.run_in_executor(None, read_samples, start_time, end_time, fleet_hosts[query['host']].log_dir)
+        return 200, [{'Timestamp': datetime.fromtimestamp(timestamp), 'CPU Usage': round(cpu_usage, 1), 'RAM Usage': round(ram_usage, 1),
+                      'GPU Devices': utilization} for timestamp, cpu_usage, ram_usage, utilization in samples]
+    return 404, {'error': 'Nicht gefunden'}
+
+async def handle_fleet_connection(reader, writer):
+    # Schlankes HTTP/1.1 mit Keep-Alive, damit ein Agent seine Verbindung zwischen den Paketen offen halten kann
+    import asyncio
+    from http import HTTPStatus
+    try:
+        while True:
+            request_line = await asyncio.wait_for(reader.readline(), FLEET_IDLE_TIMEOUT)
+            if not request_line:
+                break
+            method, target, _ = request_line.decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = await asyncio.wait_for(reader.readline(), FLEET_IDLE_TIMEOUT)
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get('content-length') or 0)
+            if length > FLEET_MAX_BODY:
+                status, data = 413, {'error': 'Paket zu groß'}
+                headers['connection'] = 'close'
+            else:
+                body = await asyncio.wait_for(reader.readexactly(length), FLEET_IDLE_TIMEOUT) if length else b''
+                try:
+                    status, data = await handle_fleet_request(method, target, headers, body)
+                except (ValueError, KeyError, TypeError, OSError) as e:
+                    status, data = 400, {'error': str(e)}
+            response_body = json.dumps(data, default=str).encode('utf-8')
+            response_headers = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}", "Content-Type: application/json"]
+            if 'gzip' in headers.get('accept-encoding', '') and len(response_body) > 512:
+                response_body = gzip.compress(response_body, compresslevel=5)
+                response_headers.append("Content-Encoding: gzip")
+            response_headers.append(f"Content-Length: {len(response_body)}")
+            writer.write(("\r\n".join(response_headers) + "\r\n\r\n").encode('latin-1') + response_body)
+            await writer.drain()
+            if headers.get('connection', '').lower() == 'close':
+                break
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+async def serve_collector():
+    import asyncio
+    load_fleet_hosts()
+    host, port = CONFIG.get('FLEET_LISTEN_HOST', '127.0.0.1'), CONFIG.get('FLEET_PORT', FLEET_PORT)
+    server = await asyncio.start_server(handle_fleet_connection, host, port)
+    logging.info(f"Collector läuft auf http://{host}:{port}/api/fleet")
+    print(f"Collector läuft auf http://{host}:{port}/api/fleet")
+    async with server:
+        while not should_stop:
+            await asyncio.sleep(1)
+    for fleet_host in fleet_hosts.values():
+        fleet_host.sample_store.close()
+
+def run_collector():
+    # asyncio wird nur für den Collector geladen, nicht bei jedem Start des Monitors
+    import asyncio
+    global CONFIG
+    CONFIG = load_config()
+    CONFIG['LOG_DIR'].mkdir(parents=True, exist_ok=True)
+    logging.basicConfig(
+        handlers=[RotatingFileHandler(CONFIG['LOG_DIR'] / 'gpu_monitor.log', maxBytes=100000, backupCount=5)],
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    # Das Reset-Datum der Flottensummen steht wie bei einem einzelnen Rechner in settings.json
+    flush_state(force=True)
+    # Der Bot wird nur zum Senden gebraucht: /reset und /status beziehen sich auf einen einzelnen Rechner
+    if CONFIG.get('ENABLE_TELEGRAM', False):
+        initialize_bot()
+    try:
+        asyncio.run(serve_collector())
+    finally:
+        stop_notifier()
+        logging.info("Collector beendet")
+
 # Initialize bot and set up message handlers
 def initialize_bot():
     global bot
     if not CONFIG.get('ENABLE_TELEGRAM', False):
         return
+    # telebot wird nur geladen, wenn Telegram aktiviert ist
+    import telebot
+    if CONFIG.get('TELEGRAM_API_URL'):
+        telebot.apihelper.API_URL = CONFIG['TELEGRAM_API_URL']
     bot = telebot.TeleBot(CONFIG['TELEGRAM_BOT_TOKEN'])
 
     @bot.message_handler(commands=['reset'])
@@ -230,13 +2801,7 @@ def initialize_bot():
     def handle_status(message):
         if str(message.chat.id) != CONFIG['TELEGRAM_CHAT_ID']:
             return
-        overall_total = calculate_filtered_total()
-        status_message = (
-            f"📊 *GPU-Überwachungsstatus*\n"
-            f"Gesamtzeit seit {last_reset_date.strftime('%Y-%m-%d')}: *{overall_total:.2f}s*\n"
-            f"Aktueller Schwellenwert: *{CONFIG['GPU_USAGE_THRESHOLD']}%*"
-        )
-        send_telegram_message(status_message)
+        send_telegram_message(get_status_message())
 
 
 def signal_handler(signum, frame):
@@ -254,23 +2819,67 @@ def check_stop_file():
         return True
     return False
 
+def get_lock_path():
+    script_dir = Path(__file__).parent
+    if os.access(script_dir, os.W_OK):
+        return script_dir / 'gpu_monitor.lock'
+    return Path(tempfile.gettempdir()) / 'gpu_monitor.lock'
+
+def acquire_instance_lock():
+    # Sperrdatei statt Suche in der Prozessliste. Das Betriebssystem gibt die Sperre auch nach einem Absturz frei.
+    global instance_lock_file
+    lock_file = open(get_lock_path(), 'a+')
+    try:
+        if sys.platform == 'win32':
+            import msvcrt
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    lock_file.seek(0)
+    lock_file.truncate()
+    lock_file.write(str(os.getpid()))
+    lock_file.flush()
+    instance_lock_file = lock_file
+    return True
+
+def require_no_running_instance():
+    # Für Befehle, die Dateien einer laufenden Instanz umschreiben oder löschen (Spool, Rollups, Logs).
+    # Die Sperre bleibt bis zum Ende des Befehls bestehen, so startet auch keine Instanz dazwischen.
+    if is_script_running():
+        print("Eine Instanz des Skripts läuft bereits. Bitte zuerst beenden, dann den Befehl erneut ausführen.")
+        sys.exit(1)
+
+def remove_pid_file():
+    # Nur die eigene PID-Datei löschen; die einer bereits laufenden Instanz braucht stopMonitoring.bat
+    try:
+        with open('gpu_monitor.pid', 'r') as f:
+            if f.read().strip() != str(os.getpid()):
+                return
+        os.remove('gpu_monitor.pid')
+    except FileNotFoundError:
+        pass
+
 def is_script_running():
-    current_process = psutil.Process()
-    for process in psutil.process_iter(['name', 'cmdline']):
-        try:
-            if process.info['name'] == current_process.name() and \
-               process.pid != current_process.pid and \
-               process.info['cmdline'] and \
-               'monitor.py' in ' '.join(process.info['cmdline']):
-                return True
-        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-            pass
-    return False
+    return instance_lock_file is None and not acquire_instance_lock()
 
 def create_image(active=False):
+    # Die Bilder werden nur einmal geladen und dekodiert
+    if active not in icon_images:
+        icon_images[active] = load_icon_image(active)
+    return icon_images[active]
+
+def load_icon_image(active):
+    from PIL import Image
     icon_path = Path(__file__).parent / ('tray_icon_active.png' if active else 'tray_icon.png')
     if icon_path.exists():
-        return Image.open(icon_path)
+        image = Image.open(icon_path)
+        image.load()
+        return image
     else:
         # Fallback zu einem einfachen Bild, wenn die Datei nicht existiert
         return Image.new('RGB', (64, 64), color = (240, 80, 0) if active else (0, 80, 240))
@@ -308,6 +2917,10 @@ def open_settings():
 def open_dashboard():
     dashboard_path = Path(__file__).parent / 'dashboard.html'
     try:
+        if http_server:
+            host, port = http_server.server_address[:2]
+            webbrowser.open(f"http://{'127.0.0.1' if host == '0.0.0.0' else host}:{port}/")
+            return
         if sys.platform == 'win32':
             os.startfile(str(dashboard_path))
         elif sys.platform == 'darwin':
@@ -317,7 +2930,13 @@ def open_dashboard():
     except Exception as e:
         log_error(f"Fehler beim Öffnen des Dashboards: {str(e)}")
 
+def create_icon():
+    # pystray und PIL werden nur im Tray-Modus geladen
+    import pystray
+    return pystray.Icon("GPU Monitor", create_image(), "GPU Monitor", create_menu())
+
 def create_menu():
+    import pystray
     return pystray.Menu(
         pystray.MenuItem('Dashboard', open_dashboard),
         pystray.MenuItem('Open Log Folder', open_log_folder),
@@ -340,45 +2959,61 @@ def format_duration(seconds):
         return f"{hours:.2f}h"
 
 def update_icon_text():
-    global icon, should_stop, filtered_total, logging_active
+    global icon, should_stop
+    snapshot = None
+    shown_active = None
     while not should_stop:
-        if icon.visible:
-            gpu_usage = get_gpu_usage()
-            filtered_total = calculate_filtered_total()  # Recalculate total before updating icon
-            formatted_total = format_duration(filtered_total)
-            icon.title = f"GPU: {gpu_usage}% | Total: {formatted_total}"
-            
-            # Update icon based on GPU usage
-            new_icon = create_image(active=logging_active)
-            icon.icon = new_icon
-        time.sleep(5)
+        snapshot = wait_for_snapshot(snapshot, 5)
+        if snapshot is None or not icon.visible:
+            continue
+        title = f"GPU: {format_gpu_usage(snapshot.gpu_usage)} | Total: {format_duration(snapshot.total)}"
+        if snapshot.peak_usage is not None:
+            title += f" | Max 5 min: {snapshot.peak_usage:.0f}%"
+        if icon.title != title:
+            icon.title = title
+
+        # Icon nur tauschen, wenn sich der Sitzungsstatus ändert
+        active = bool(snapshot.active_sessions)
+        if active != shown_active:
+            shown_active = active
+            icon.icon = create_image(active=active)
 
 def get_status_message():
-    overall_total = calculate_filtered_total()
-    return (
+    snapshot = get_snapshot()
+    message = (
         f"📊 *GPU-Überwachungsstatus*\n"
-        f"Gesamtzeit seit {last_reset_date.strftime('%Y-%m-%d')}: *{overall_total:.2f}s*\n"
+        f"Gesamtzeit seit {snapshot.last_reset_date.strftime('%Y-%m-%d')}: *{snapshot.total:.2f}s*\n"
+        f"Aktuelle Auslastung: *{format_gpu_usage(snapshot.gpu_usage)}*\n"
         f"Aktueller Schwellenwert: *{CONFIG['GPU_USAGE_THRESHOLD']}%*"
     )
+    if len(snapshot.device_totals) > 1:
+        message += "".join(f"\nGPU {device}: {total:.2f}s" for device, total in sorted(snapshot.device_totals.items()))
+    if snapshot.user_totals:
+        top_users = heapq.nlargest(TOP_PROCESS_COUNT, snapshot.user_totals.items(), key=lambda item: item[1])
+        message += "\nGPU-Zeit pro Benutzer:" + "".join(f"\n{user}: {seconds:.2f}s" for user, seconds in top_users)
+    if instrumentation_enabled:
+        message += "\nLaufzeiten:\n" + "\n".join(format_instrumentation_stats())
+    return message
 
-# Erstellen Sie das Icon global
-icon = pystray.Icon("GPU Monitor", create_image(), "GPU Monitor", create_menu())
-
-def main(autostart=False):
-    global should_stop, last_log_time, gpu_usage_start, cool_down_start, logging_active, icon, filtered_total, CONFIG, bot
+def main(autostart=False, headless=False):
+    global should_stop, last_log_time, gpu_usage_start, cool_down_start, logging_active, icon, filtered_total, CONFIG, bot, rollups, live_samples, session_journal
     
-    try:
-        if is_script_running():
-            print("Eine Instanz des Skripts läuft bereits. Beende diesen Prozess.")
-            logging.info("Versuch, eine zweite Instanz zu starten. Beende den Prozess.")
-            sys.exit(0)
+    # Vor dem try: eine zweite Instanz beendet sich, ohne die Aufräumarbeiten im finally auszuführen
+    if is_script_running():
+        print("Eine Instanz des Skripts läuft bereits. Beende diesen Prozess.")
+        logging.info("Versuch, eine zweite Instanz zu starten. Beende den Prozess.")
+        sys.exit(0)
 
+    icon_thread = None
+    try:
         CONFIG = load_config()
-        filtered_total = calculate_filtered_total()
 
         if CONFIG.get('ENABLE_TELEGRAM', False):
             initialize_bot()
 
+        if not headless:
+            icon = create_icon()
+
         CONFIG['LOG_DIR'] = Path(CONFIG['LOG_DIR'])
         CONFIG['LOG_DIR'].mkdir(parents=True, exist_ok=True)
 
@@ -389,6 +3024,25 @@ def main(autostart=False):
             format='%(asctime)s - %(levelname)s - %(message)s'
         )
 
+        if CONFIG.get('ENABLE_INSTRUMENTATION', False):
+            install_instrumentation()
+
+        load_ledger()
+        flush_state(force=True)
+
+        session_journal = SessionJournal(CONFIG['LOG_DIR'])
+        try:
+            recover_sessions(session_journal)
+        except Exception as e:
+            log_error(f"Fehler beim Wiederherstellen der Sitzungen aus dem Journal: {str(e)}")
+
+        # Auch bei leerem Spool, damit das Schema der Notion-Datenbank gleich beim Start geprüft wird
+        if CONFIG.get('ENABLE_NOTION', False):
+            enqueue_notification('notion', None)
+
+        # Erste Messung der Prozesstabelle, damit der erste Eintrag im regulären Log echte CPU-Werte enthält
+        update_process_table()
+
         time.sleep(2)
 
         if not autostart:
@@ -405,29 +3059,76 @@ def main(autostart=False):
             except Exception as e:
                 logging.error(f"Fehler beim Senden der Startnachricht: {str(e)}")
 
-        icon_thread = threading.Thread(target=icon.run, args=(setup,))
-        icon_thread.start()
+        sampler_thread = threading.Thread(target=gpu_sampler_loop, daemon=True)
+        sampler_thread.start()
+
+        if CONFIG.get('ENABLE_HTTP_API', False) or CONFIG.get('ENABLE_METRICS', False):
+            try:
+                start_http_server()
+            except OSError as e:
+                log_error(f"HTTP-API konnte nicht gestartet werden: {str(e)}")
+
+        if CONFIG.get('ENABLE_ATTRIBUTION', False):
+            attribution_thread = threading.Thread(target=compute_app_sampler_loop, daemon=True)
+            attribution_thread.start()
+
+        if CONFIG.get('ENABLE_LOG_COMPACTION', False):
+            compaction_thread = threading.Thread(target=log_compaction_loop, daemon=True)
+            compaction_thread.start()
+
+        if CONFIG.get('FLEET_COLLECTOR_URL'):
+            start_fleet_agent()
+
+        if icon:
+            icon_thread = threading.Thread(target=icon.run, args=(setup,))
+            icon_thread.start()
 
-        update_thread = threading.Thread(target=update_icon_text)
-        update_thread.daemon = True
-        update_thread.start()
+            update_thread = threading.Thread(target=update_icon_text)
+            update_thread.daemon = True
+            update_thread.start()
 
         if CONFIG.get('ENABLE_TELEGRAM', False):
             bot_thread = threading.Thread(target=bot.polling, daemon=True)
             bot_thread.start()
 
+        sample_store = SampleStore(CONFIG['LOG_DIR'])
+        rollups = Rollups(CONFIG['LOG_DIR'])
+        live_samples = SampleRing(get_live_buffer_capacity())
+        last_tick = None
+        cool_down_busy = {}
+        cool_down_period = timedelta(seconds=CONFIG['COOL_DOWN_PERIOD'])
+        clock = MonitorClock()
+        scheduler = TickScheduler()
+        tick_interval = CONFIG['CHECK_INTERVAL']
+        last_stats_time = clock.monotonic()
         while not should_stop:
             try:
+                tick_started = time.perf_counter()
                 if check_stop_file():
                     should_stop = True
                     break
 
-                current_time = datetime.now()
+                current_time = clock.tick(bool(gpu_usage_start))
                 
                 gpu_usage = get_gpu_usage()
                 if gpu_usage is None:
-                    time.sleep(CONFIG['CHECK_INTERVAL'])
+                    count_event('stale_sample')
+                    publish_snapshot(make_snapshot(current_time, None, None, None))
+                    tick_interval = CONFIG['CHECK_INTERVAL']
+                    scheduler.wait(tick_interval, lambda: should_stop)
                     continue
+
+                cpu_usage = psutil.cpu_percent()
+                ram_usage = psutil.virtual_memory().percent
+                sample_time = clock.timestamp()
+                live_samples.append(sample_time, cpu_usage, ram_usage, gpu_usage)
+                try:
+                    stored = sample_store.append(sample_time, cpu_usage, ram_usage, gpu_usage)
+                except Exception as e:
+                    stored = False
+                    log_error(f"Fehler beim Schreiben der Messdatei: {str(e)}")
+                if fleet_thread and stored:
+                    add_fleet_sample(sample_time, cpu_usage, ram_usage, gpu_usage)
                 
                 if (current_time - last_log_time).total_seconds() >= CONFIG['LOG_INTERVAL']:
                     system_info = get_system_info()
@@ -437,34 +3138,86 @@ def main(autostart=False):
                             last_log_time = current_time
                         except Exception as e:
                             log_error(f"Fehler beim Loggen der regulären Info: {str(e)}")
+
+                tick = clock.monotonic()
+                elapsed = min(tick - last_tick, 2 * tick_interval) if last_tick is not None else 0
+                last_tick = tick
+
+                # GPU-Sekunden seit dem letzten Durchlauf den laufenden Prozessen zuordnen
+                if CONFIG.get('ENABLE_ATTRIBUTION', False) and elapsed:
+                    attribute_gpu_usage(gpu_usage, elapsed)
+
+                # Zeit in laufenden Sitzungen für die Rollups. Die Abkühlphase zählt erst, wenn die Sitzung danach weiterläuft.
+                busy_seconds = 0
+                for device in gpu_usage_start:
+                    if device in cool_down_start:
+                        cool_down_busy[device] = cool_down_busy.get(device, 0) + elapsed
+                    else:
+                        busy_seconds += elapsed
                 
-                if gpu_usage > CONFIG['GPU_USAGE_THRESHOLD']:
-                    if gpu_usage_start is None:
-                        gpu_usage_start = current_time
+                # Jede GPU hat ihre eigene Nutzungssitzung mit eigener Abkühlphase
+                for reading in gpu_usage:
+                    device = reading.index
+                    session_start, session_end = gpu_usage_start.get(device), cool_down_start.get(device)
+                    new_start, new_cool_down, event = step_session(session_start, session_end, current_time, reading.utilization,
+                                                                   CONFIG['GPU_USAGE_THRESHOLD'], cool_down_period)
+                    if event is None:
+                        continue
+                    gpu_usage_start.pop(device, None)
+                    cool_down_start.pop(device, None)
+                    if new_start is not None:
+                        gpu_usage_start[device] = new_start
+                    if new_cool_down is not None:
+                        cool_down_start[device] = new_cool_down
+
+                    if event == 'open':
+                        session_journal.open_session(device, current_time)
+                        rollups.add_session(current_time)
                         if CONFIG.get('ENABLE_TELEGRAM', False):
-                            send_telegram_message(f"🔥 *GPU-Nutzung über Schwellenwert*\nAktuell: *{gpu_usage}%*")
-                        logging_active = True
-                        icon.icon = create_image(active=True)
-                    cool_down_start = None
-                elif gpu_usage_start is not None:
-                    if cool_down_start is None:
-                        cool_down_start = current_time
-                    elif (current_time - cool_down_start).total_seconds() >= CONFIG['COOL_DOWN_PERIOD']:
-                        duration = (cool_down_start - gpu_usage_start).total_seconds()
-                        log_gpu_usage(gpu_usage_start, cool_down_start, duration)
+                            send_telegram_message(f"🔥 *GPU {device}: Nutzung über Schwellenwert*\nAktuell: *{reading.utilization}%*")
+                    elif event == 'resume':
+                        session_journal.cancel_cool_down(device, current_time)
+                    elif event == 'cool_down':
+                        session_journal.start_cool_down(device, current_time)
+                    elif event == 'close':
+                        duration = (session_end - session_start).total_seconds()
+                        # Erst ins Journal, dann ins CSV: bricht das Schreiben ab, wird die Sitzung beim nächsten Start nachgetragen
+                        session_journal.close_session(device, session_start, session_end, duration)
+                        log_gpu_usage(device, session_start, session_end, duration)
+                        if CONFIG.get('ENABLE_ATTRIBUTION', False):
+                            log_gpu_attribution(device, session_start, session_end)
                         if CONFIG.get('ENABLE_NOTION', False):
-                            update_notion(gpu_usage_start, cool_down_start, duration)
-                        gpu_usage_start = None
-                        cool_down_start = None
-                        logging_active = False
-                        icon.icon = create_image(active=False)
-                
-                try:
-                    save_config()
-                except Exception as e:
-                    log_error(f"Fehler beim Speichern der Konfiguration: {str(e)}")
+                            update_notion(device, session_start, session_end, duration)
+                        if CONFIG.get('FLEET_COLLECTOR_URL'):
+                            update_fleet(device, session_start, session_end, duration)
+                        session_journal.compact(gpu_usage_start, cool_down_start)
+
+                if gpu_usage_start:
+                    session_journal.heartbeat(current_time)
 
-                time.sleep(CONFIG['CHECK_INTERVAL'])
+                if CONFIG.get('ENABLE_ATTRIBUTION', False):
+                    settle_cool_down_attribution()
+                for device in list(cool_down_busy):
+                    if device not in gpu_usage_start:
+                        del cool_down_busy[device]
+                    elif device not in cool_down_start:
+                        busy_seconds += cool_down_busy.pop(device)
+                rollups.add_sample(current_time, get_mean_utilization(gpu_usage), cpu_usage, ram_usage, busy_seconds)
+
+                logging_active = bool(gpu_usage_start)
+                publish_snapshot(make_snapshot(current_time, gpu_usage, cpu_usage, ram_usage))
+
+                tick_interval = get_tick_interval(gpu_usage)
+                if instrumentation_enabled:
+                    record_tick(time.perf_counter() - tick_started, tick_interval)
+                    event_counts['missed_tick'] = scheduler.missed
+                    if clock.monotonic() - last_stats_time >= CONFIG.get('STATS_INTERVAL', CONFIG['LOG_INTERVAL']):
+                        report_instrumentation_stats()
+                        last_stats_time = clock.monotonic()
+                if tick_interval > CONFIG['CHECK_INTERVAL']:
+                    scheduler.wait(tick_interval, lambda: should_stop or sampler_left_idle())
+                else:
+                    scheduler.wait(tick_interval, lambda: should_stop)
 
             except Exception as e:
                 log_error(f"Unerwarteter Fehler in der Hauptschleife: {str(e)}")
@@ -480,22 +3233,81 @@ def main(autostart=False):
                 logging.error(f"Fehler beim Senden der kritischen Fehlermeldung: {str(telegram_error)}")
     finally:
         should_stop = True
-        icon.stop()
-        icon_thread.join()
+        stop_gpu_sampler()
+        stop_http_server()
+        stop_fleet_agent()
+        flush_state()
+        if rollups:
+            rollups.close()
+        if session_journal:
+            session_journal.close(gpu_usage_start)
+        if icon_thread:
+            icon.stop()
+            icon_thread.join()
         logging.info("GPU-Überwachung beendet")
-        if CONFIG.get('ENABLE_TELEGRAM', False):
+        if CONFIG and CONFIG.get('ENABLE_TELEGRAM', False):
             send_telegram_message("🛑 *GPU-Überwachung wurde beendet*")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--autostart', action='store_true', help='Startet im Autostart-Modus ohne PID-Datei zu erstellen')
+    parser.add_argument('--headless', action='store_true', help='Startet ohne Tray-Icon (z.B. als Dienst auf Servern ohne Desktop)')
+    parser.add_argument('--notion-backfill', action='store_true', help='Lädt alle Sitzungen aus den CSV-Logs, die in Notion fehlen, hoch und beendet sich')
+    parser.add_argument('--rebuild-rollups', action='store_true', help='Erstellt die Rollup-Dateien aus den vorhandenen Logs neu und beendet sich')
+    parser.add_argument('--replay', action='store_true', help='Wertet die gespeicherten Messungen für mehrere Schwellenwerte und Abkühlphasen aus und beendet sich')
+    parser.add_argument('--thresholds', nargs='+', type=float, metavar='PROZENT', help='Schwellenwerte für --replay (Standard: GPU_USAGE_THRESHOLD)')
+    parser.add_argument('--cool-downs', nargs='+', type=float, metavar='SEKUNDEN', help='Abkühlphasen für --replay (Standard: COOL_DOWN_PERIOD)')
+    parser.add_argument('--start', metavar='YYYY-MM-DD', help='Beginn des Zeitraums für --replay')
+    parser.add_argument('--end', metavar='YYYY-MM-DD', help='Ende des Zeitraums für --replay (einschließlich)')
+    parser.add_argument('--verify', action='store_true', help='Vergleicht bei --replay jede Kombination mit dem Zustandsautomaten der Hauptschleife')
+    parser.add_argument('--collector', action='store_true', help='Startet als Collector, der die Messungen und Sitzungen mehrerer Agenten annimmt (Flottenbetrieb)')
+    parser.add_argument('--compact-logs', action='store_true', help='Komprimiert abgeschlossene Tage, fasst abgeschlossene Monate zusammen, löscht abgelaufene Logs und beendet sich')
+    parser.add_argument('--export-samples', nargs='+', metavar='YYYY-MM-DD', help='Exportiert die binären Messdateien der angegebenen Tage (oder "all") als CSV und beendet sich')
     args = parser.parse_args()
 
+    if args.export_samples:
+        CONFIG = load_config()
+        export_samples(args.export_samples)
+        sys.exit(0)
+
+    if args.replay:
+        CONFIG = load_config()
+        start_time = datetime.strptime(args.start, "%Y-%m-%d") if args.start else None
+        end_time = datetime.strptime(args.end, "%Y-%m-%d") + timedelta(days=1) if args.end else None
+        success = run_replay(args.thresholds or [CONFIG['GPU_USAGE_THRESHOLD']], args.cool_downs or [CONFIG['COOL_DOWN_PERIOD']],
+                             start_time, end_time, args.verify)
+        sys.exit(0 if success else 1)
+
+    if args.rebuild_rollups:
+        require_no_running_instance()
+        CONFIG = load_config()
+        rebuild_rollups()
+        sys.exit(0)
+
+    if args.compact_logs:
+        require_no_running_instance()
+        CONFIG = load_config()
+        load_ledger()
+        compressed, archived, deleted = compact_logs()
+        print(f"{compressed} Dateien komprimiert, {archived} in Monatsarchive übernommen, {deleted} gelöscht.")
+        sys.exit(0)
+
+    if args.notion_backfill:
+        require_no_running_instance()
+        CONFIG = load_config()
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+        backfill_notion()
+        sys.exit(0)
+
     signal.signal(signal.SIGTERM, signal_handler)
     signal.signal(signal.SIGINT, signal_handler)
+
+    if args.collector:
+        run_collector()
+        sys.exit(0)
     
     try:
-        main(args.autostart)
+        main(args.autostart, args.headless)
     except Exception as e:
         logging.exception("Kritischer Fehler: Bot konnte nicht gestartet werden")
         if CONFIG and CONFIG.get('ENABLE_TELEGRAM', False):
@@ -504,10 +3316,8 @@ if __name__ == "__main__":
             except Exception as telegram_error:
                 logging.error(f"Fehler beim Senden der Fehlermeldung über Telegram: {str(telegram_error)}")
     finally:
+        stop_notifier()
         if bot:
             bot.stop_polling()
         if not args.autostart:
-            try:
-                os.remove('gpu_monitor.pid')
-            except FileNotFoundError:
-                pass
\ No newline at end of file
+            remove_pid_file()
\ No newline at end of file